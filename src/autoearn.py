@@ -1,15 +1,19 @@
 from abc import ABC, abstractmethod
 import asyncio    
 import json
-from common import dict2str
+from common import dict2str, interval_to_ms
 from database import Database, Operation
-from log import logger
-from wsclient import PublicClient,PrivateClient
-from pipeline import CalculateScorePipeline, PipelineContext
+from log import logger, set_log_fields
+from pipeline import CalculateScorePipeline, PipelineContext, PipelineFactory
 from datetime import datetime, timezone, timedelta
 from restfulclient import RestfulClient
+from orderid import ClientOrderIdGenerator
+from orderbook import OrderBook
+from runtime import RuntimeConfig, StagedRuntime
+from profiler import stage
 import yaml
 import os
+import time
 
 
 class OperationType:
@@ -29,17 +33,45 @@ class AccountConfig:
 
 class TradeConfig:
 
-    def __init__(self, inst, balance, runtime, candle_interval='5m'):
+    def __init__(self, inst, balance, runtime, candle_interval='5m', bus=None, stop_loss_pct=None, take_profit_pct=None, attach_tpsl=False, tpsl_check_interval=5, book_channel=None):
         self.inst = inst
         self.balance = balance
         self.runtime = runtime
         self.candle_interval = candle_interval
+        self.bus = bus  # 共享内存行情总线名称, 配置后从 ingest 进程读取K线而不是自己订阅
+        self.stop_loss_pct = stop_loss_pct
+        self.take_profit_pct = take_profit_pct
+        self.attach_tpsl = attach_tpsl  # 开仓时附带交易所端止盈止损单
+        self.tpsl_check_interval = tpsl_check_interval  # 检查止盈止损单是否已触发的间隔(秒)
+        self.book_channel = book_channel  # books/books5, 订阅订单簿供 pipeline 使用
 
 class DebugConfig:
     def __init__(self, debug, datafile):
         self.debug = debug
         self.datafile = datafile
 
+class TraceConfig:
+    def __init__(self, enabled=False, dir="trace"):
+        self.enabled = enabled
+        self.dir = dir
+
+class JournalConfig:
+    def __init__(self, enabled=False, dir="journal", name=None, snapshot_interval=1000, fsync=False):
+        self.enabled = enabled
+        self.dir = dir
+        self.name = name
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+
+class FeedConfig:
+    def __init__(self, enabled=True, stale_after=30, ping_interval=15, pong_timeout=10, max_latency_ms=5000, pause_on_stale=True):
+        self.enabled = enabled
+        self.stale_after = stale_after
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.max_latency_ms = max_latency_ms
+        self.pause_on_stale = pause_on_stale  # 行情过期期间暂停决策
+
 class Candle:
 
     COLOR_GREEN = 'green'
@@ -112,6 +144,8 @@ class OrderInfo:
 
 class AutoEarn(object):
 
+    BOOK_RESUBSCRIBE_INTERVAL = 5  # 订单簿失去同步时重新订阅的最小间隔(秒)
+
     @staticmethod
     def from_config(config_path):
 
@@ -121,16 +155,35 @@ class AutoEarn(object):
             trade_config = config.get("trade", {})
             debug_config = config.get("debug", {})
             account = AccountConfig(account_config.get("api_key"), account_config.get("api_secret_key"), account_config.get("passphrase"), str(account_config.get("flag")))
-            trade = TradeConfig(trade_config.get("inst"), trade_config.get("balance"), trade_config.get("runtime",-1),candle_interval=trade_config.get("candle_interval", "5m"))
+            trade = TradeConfig(trade_config.get("inst"), trade_config.get("balance"), trade_config.get("runtime",-1),candle_interval=trade_config.get("candle_interval", "5m"), bus=trade_config.get("bus"),
+                                stop_loss_pct=trade_config.get("stop_loss_pct"), take_profit_pct=trade_config.get("take_profit_pct"),
+                                attach_tpsl=trade_config.get("attach_tpsl", False), tpsl_check_interval=trade_config.get("tpsl_check_interval", 5),
+                                book_channel=trade_config.get("book_channel"))
             debug = DebugConfig(debug_config.get("debug", False), debug_config.get("datafile"))
-        return AutoEarn(account, trade, debug)
-
-
-    def __init__(self, account_config: AccountConfig, trade_config: TradeConfig, debug_config: DebugConfig):
+            trace_config = config.get("trace", {})
+            trace = TraceConfig(trace_config.get("enabled", False), trace_config.get("dir", "trace"))
+            journal_config = config.get("journal", {})
+            journal = JournalConfig(journal_config.get("enabled", False), journal_config.get("dir", "journal"), journal_config.get("name"),
+                                    journal_config.get("snapshot_interval", 1000), journal_config.get("fsync", False))
+            runtime_config = config.get("runtime", {})
+            runtime = RuntimeConfig(runtime_config.get("staged", False), runtime_config.get("decision_queue", 1024), runtime_config.get("execute_queue", 16),
+                                    runtime_config.get("persist_queue", 1024), runtime_config.get("persist_workers", 2), runtime_config.get("stats_interval", 60))
+            feed_config = config.get("feed", {})
+            feed = FeedConfig(feed_config.get("enabled", True), feed_config.get("stale_after", 30), feed_config.get("ping_interval", 15),
+                              feed_config.get("pong_timeout", 10), feed_config.get("max_latency_ms", 5000), feed_config.get("pause_on_stale", True))
+        return AutoEarn(account, trade, debug, trace, journal, runtime, feed)
+
+
+    def __init__(self, account_config: AccountConfig, trade_config: TradeConfig, debug_config: DebugConfig, trace_config: TraceConfig = None, journal_config: JournalConfig = None, runtime_config: RuntimeConfig = None, feed_config: FeedConfig = None):
         self.id = datetime.now().strftime("%Y%m%d%H%M%S")
         self.account_config = account_config
         self.trade_config = trade_config
         self.debug_config = debug_config
+        set_log_fields(inst=trade_config.inst)
+        self.trace_config = trace_config
+        self.journal_config = journal_config
+        self.runtime_config = runtime_config
+        self.feed_config = feed_config
         
         if self.debug_config and self.debug_config.debug:
             self.db = Database("sqlite:///autoearn.db")
@@ -144,10 +197,34 @@ class AutoEarn(object):
         self.in_position = None  # Track whether we are in a position ('long' or 'short')
         self.entry_price = 0  # Price at which we entered the position
         self.profit_percentage = 0  # Current profit percentage
+        self.tpsl_algo_id = None  # attachAlgoClOrdId of the exchange-side TP/SL attached to the open position
+        self.tpsl_checked_at = 0
+        self.reconnect_count = 0  # Number of websocket reconnects
+        self.last_reconnect_seconds = 0  # Downtime of the last reconnect
+        self.gap_fill_count = 0  # Number of candle gaps filled over REST
+        self.backfilled_candle_count = 0  # Number of candles fetched to fill gaps
+        self.paused = False  # Decisions are skipped while the candle feed is stale
+        self.stale_count = 0  # Number of times the candle feed went stale
+        self.last_tick = time.monotonic()  # When the last candle was processed, reported to the supervisor
+        self.position_listeners = []  # Called after every position change, e.g. the supervisor status report
+        self.reported_position = None
         # self.stop_loss_pct = -5  # Stop loss percentage (e.g., -5%)
         # self.take_profit_pct = 10  # Take profit percentage (e.g., 10%)
 
         self.score_pipeline = CalculateScorePipeline()
+        self.book = OrderBook() if trade_config.book_channel else None
+        self.book_client = None
+        self.book_resubscribed_at = -self.BOOK_RESUBSCRIBE_INTERVAL
+        self.recorder = None
+        if self.trace_config and self.trace_config.enabled:
+            from tracer import DecisionRecorder
+            self.recorder = DecisionRecorder(os.path.join(self.trace_config.dir, f"trace-{self.id}.bin"), PipelineFactory.PIPELINES.keys())
+        self.journal = None
+        if self.journal_config and self.journal_config.enabled:
+            from journal import StateJournal
+            name = self.journal_config.name or f"{trade_config.inst}-{trade_config.candle_interval}"
+            self.journal = StateJournal(self.journal_config.dir, name, self.journal_config.snapshot_interval, self.journal_config.fsync)
+        self.order_ids = ClientOrderIdGenerator()
         self.restful_client = RestfulClient(account_config.api_key, account_config.api_secret_key, account_config.passphrase, account_config.flag)
         
 
@@ -161,18 +238,84 @@ class AutoEarn(object):
         return {
             'available_balance': self.available_balance,
             'in_position': self.in_position,
+            'position_stock': self.position_stock,
             'entry_price': self.entry_price,
-            'profit_percentage': self.profit_percentage
+            'tpsl_algo_id': self.tpsl_algo_id,
+            'profit_percentage': self.profit_percentage,
+            'reconnect_count': self.reconnect_count,
+            'last_reconnect_seconds': self.last_reconnect_seconds,
+            'gap_fill_count': self.gap_fill_count,
+            'backfilled_candle_count': self.backfilled_candle_count,
+            'paused': self.paused,
+            'stale_count': self.stale_count,
+            'tick_age': time.monotonic() - self.last_tick
         }
 
+    def restore(self, state):
+        """Restore the position state reported by dump(), e.g. when a supervised worker is restarted."""
+        self.available_balance = state.get('available_balance', self.available_balance)
+        self.in_position = state.get('in_position')
+        self.position_stock = state.get('position_stock', 0)
+        self.entry_price = state.get('entry_price', 0)
+        self.tpsl_algo_id = state.get('tpsl_algo_id')
+        logger.info("Restored state:\n%s", str(self))
+
+    def recover(self):
+        """Rebuild position and candle window from the state journal, then check the position against the exchange."""
+        state = self.journal.recover()
+        if state is None:
+            return
+        self.restore(state)
+        self.last_candles = [Candle(*c, True) for c in state['candles']]
+        logger.info("Recovered %d candles from journal", len(self.last_candles))
+        if not (self.debug_config and self.debug_config.debug):
+            self.verify_position()
+
+    def verify_position(self):
+        """A recovered long position must still be held on the exchange, otherwise it was closed while we were down."""
+        if self.in_position != "long":
+            return
+        ccy = self.trade_config.inst.split("-")[0]
+        try:
+            res = self.restful_client.accountAPI().get_account_balance(ccy=ccy)
+        except Exception as e:
+            logger.error("Failed to verify recovered position: %s", e)
+            return
+        if res['code'] != '0':
+            logger.error("Failed to verify recovered position, error code: %s, error message: %s", res['code'], res['msg'])
+            return
+        held = sum(float(item.get('cashBal') or 0) for item in res['data'][0]['details'] if item['ccy'] == ccy)
+        if held < float(self.position_stock) * 0.99:
+            logger.error("Recovered long position of %s %s but exchange holds %s, resetting to flat", self.position_stock, ccy, held)
+            self.in_position = None
+            self.position_stock = 0
+            self.entry_price = 0
+            self.journal_position()
+        else:
+            logger.info("Recovered long position of %s %s verified against exchange balance %s", self.position_stock, ccy, held)
+
+    def journal_position(self):
+        """Persist the position to the journal and notify position_listeners when it changed."""
+        if self.journal:
+            self.journal.record_position(self.available_balance, self.in_position, self.position_stock, self.entry_price, self.tpsl_algo_id)
+        position = (self.available_balance, self.in_position, self.position_stock, self.entry_price, self.tpsl_algo_id)
+        if position != self.reported_position:
+            self.reported_position = position
+            for listener in self.position_listeners:
+                listener()
+
+    @property
+    def replays_datafile(self):
+        """Debug runs replaying a recorded file end by themselves, every other feed runs until stopped."""
+        return bool(self.debug_config and self.debug_config.debug and self.debug_config.datafile)
+
 
     def parseData(self, message):
-        if self.debug_config and self.debug_config.debug:
-            pass
-        else:
-            with open(f"testdata/data-{self.id}", "a") as f:
-                f.write(message)
-                f.write("\n")
+        with stage("parseData"):
+            self.handleMessage(message)
+
+    def handleMessage(self, message):
+        self.recordMessage(message)
 
 
         parsed_data = json.loads(message)
@@ -181,27 +324,167 @@ class AutoEarn(object):
         if len(parsed_data['data']) == 0:
             return
         [timestamp, _open, high, low, close, isfinish] = parsed_data['data'][0]
+        self.onCandle(Candle.from_data([timestamp, _open, high, low, close, isfinish]))
+
+    def parseBook(self, message):
+        parsed_data = json.loads(message)
+        if not parsed_data.get('data'):
+            return
+        action = parsed_data.get('action', 'snapshot')
+        if self.book.apply(action, parsed_data['data'][0]):
+            return
+        # 失去同步(或过期后被置为无效)期间的增量都会失败, 按间隔重新订阅直到新快照到达, 避免每条增量都重连
+        now = time.monotonic()
+        if now - self.book_resubscribed_at >= self.BOOK_RESUBSCRIBE_INTERVAL:
+            self.book_resubscribed_at = now
+            logger.warning("Order book out of sync (checksum failures: %d), resubscribing", self.book.checksum_failures)
+            self.book_client.spawn(self.book_client.handle_disconnection())
+
+    def start_book_feed(self):
+        """Subscribe to the order book on the public endpoint, in the event loop of the candle feed."""
+        if self.book is None:
+            return
+        from wsclient import PublicClient
+        args = {"channel": self.trade_config.book_channel, "instId": self.trade_config.inst}
+        logger.info("Parameters:\n%s", dict2str(args))
+        self.book_client = PublicClient("wss://wspap.okx.com:8443/ws/v5/public", [args], self.parseBook,
+                                        watchdog=self.feed_watchdog(), on_stale=self.on_book_stale)
+        self.book_client.spawn(self.book_client.run_client())
+
+    def recordMessage(self, message):
+        if self.debug_config and self.debug_config.debug:
+            pass
+        else:
+            with open(f"testdata/data-{self.id}", "a") as f:
+                f.write(message)
+                f.write("\n")
+
+    def onCandle(self, candle):
+        self.updateCandles(candle)
+        if self.tpsl_due():
+            self.reconcile_tpsl()
+        self.makeDecision()
+        self.journal_position()
+
+    def updateCandles(self, candle, missing=None):
+        """`missing` are finished candles already fetched by fetch_missing_candles, fetched here when None."""
+        set_log_fields(tick=candle.timestamp)
+        self.last_tick = time.monotonic()
         # Remove the oldest candle if we have more than 30
         if len(self.last_candles) > 30:
             self.last_candles.pop(0)
 
         # Make a decision only when the candle is finished
-        candle = Candle.from_data([timestamp, _open, high, low, close, isfinish])
-        
         if candle.isfinish:
             #logger.info("Last candle: %s", candle)
             #logger.info(self.last_candles)
-            self.last_candles.append(candle)
+            if missing is not None:
+                self.splice_candles(missing, until=candle.timestamp)
+            elif not (self.debug_config and self.debug_config.debug):
+                self.backfill_candles(until=candle.timestamp)
+            if not self.last_candles or candle.timestamp > self.last_candles[-1].timestamp:
+                self.last_candles.append(candle)
+                if self.journal:
+                    self.journal.record_candle(candle)
             self.current_candles = []
         else:
             #logger.info("Current candle: %s", candle)
             self.current_candles.append(candle)
-        
-        self.makeDecision()
            
 
+    def backfill_candles(self, until=None):
+        """
+        补齐断线期间丢失的已完成K线: 通过REST拉取 last_candles[-1] 之后(到 until 之前)的K线并拼接到历史中。
+        Fetch the finished candles missing after the last known one (and before `until` when given) and splice them into history.
+        """
+        return self.splice_candles(self.fetch_missing_candles(until), until)
+
+    def fetch_missing_candles(self, until=None):
+        """
+        REST part of backfill_candles, does not modify any state so the staged runtime can run it in a worker thread.
+        Returns the missing finished candles, oldest first.
+        """
+        interval = interval_to_ms(self.trade_config.candle_interval)
+        if not self.last_candles or interval is None:
+            return []
+        last_ts = self.last_candles[-1].timestamp
+        if until is not None and until - last_ts <= interval:
+            return []
+
+        try:
+            result = self.restful_client.get_index_candles(self.trade_config.inst, self.trade_config.candle_interval,
+                                                           after=until or '', before=last_ts)
+        except Exception as e:
+            logger.error("Failed to backfill candles after %s: %s", last_ts, e)
+            return []
+        if result.get('code') != '0':
+            logger.error("Failed to backfill candles, error code: %s, error message: %s", result.get('code'), result.get('msg'))
+            return []
+
+        candles = sorted((Candle.from_data(row[:6]) for row in result['data']), key=lambda c: c.timestamp)
+        return [c for c in candles if c.isfinish and c.timestamp > last_ts and (until is None or c.timestamp < until)]
+
+    def splice_candles(self, missing, until=None):
+        if not self.last_candles:
+            return 0
+        last_ts = self.last_candles[-1].timestamp
+        missing = [c for c in missing if c.timestamp > last_ts]
+        if not missing:
+            return 0
+
+        self.last_candles.extend(missing)
+        if self.journal:
+            for c in missing:
+                self.journal.record_candle(c)
+        if len(self.last_candles) > 30:
+            self.last_candles = self.last_candles[-30:]
+        self.gap_fill_count += 1
+        self.backfilled_candle_count += len(missing)
+        logger.info("Backfilled %d candles between %s and %s (gaps filled: %d, candles backfilled: %d)",
+                    len(missing), last_ts, until, self.gap_fill_count, self.backfilled_candle_count)
+        return len(missing)
+
+    def on_reconnect(self, downtime, missing=None):
+        self.reconnect_count += 1
+        self.last_reconnect_seconds = downtime
+        logger.info("Websocket reconnected after %.2fs, reconnects: %d", downtime, self.reconnect_count)
+        self.current_candles = []
+        if missing is None:
+            self.backfill_candles()
+        else:
+            self.splice_candles(missing)
+
+    def feed_watchdog(self, interval_ms=None):
+        if not self.feed_config or not self.feed_config.enabled:
+            return None
+        from wsclient import FeedWatchdog
+        return FeedWatchdog(self.feed_config.stale_after, self.feed_config.ping_interval, self.feed_config.pong_timeout,
+                            self.feed_config.max_latency_ms, interval_ms)
+
+    def on_stale(self, stale, seconds):
+        """Called by the candle feed watchdog when the feed goes stale or recovers."""
+        if stale:
+            self.stale_count += 1
+        if not self.feed_config.pause_on_stale:
+            return
+        self.paused = stale
+        if stale:
+            logger.warning("No fresh candles for %.1fs, pausing decisions (position: %s)", seconds, self.in_position)
+        else:
+            logger.info("Candle feed recovered, resuming decisions")
+
+    def on_book_stale(self, stale, seconds):
+        if stale:
+            # 过期的订单簿不再提供给 pipeline, 重新订阅后的快照会恢复
+            self.book.valid = False
+
     def makeDecision(self):
+        if self.paused:
+            return
         op, score = self.calculateScore()
+        self.applyDecision(op, score)
+
+    def applyDecision(self, op, score):
         if not op:
             logger.debug("No trade operation. skip")
             return
@@ -211,8 +494,9 @@ class AutoEarn(object):
                 self.exitPosition()
         else:
             if score:
-                if len(self.current_candles) > 0:
-                    current_close = self.current_candles[-1].close
+                current_candles = self.current_candles  # 分阶段运行时决策阶段可能同时替换该列表
+                if len(current_candles) > 0:
+                    current_close = current_candles[-1].close
                 else:
                     current_close = self.last_candles[-1].close
                 # Buy conditions (Long position)
@@ -232,58 +516,166 @@ class AutoEarn(object):
             self.current_candles,
             self.in_position, 
             self.position_stock, 
-            self.entry_price)
+            self.entry_price,
+            self.book if self.book and self.book.valid else None)
         self.score_pipeline.execute(context)
         #logger.info(context)
+        if self.recorder:
+            candle = self.current_candles[-1] if self.current_candles else self.last_candles[-1]
+            self.recorder.append(context, candle.timestamp, candle.close)
         return context.operation, context.score
 
     
-    def operation(self, side, quantity=None):
+    def operation(self, side, quantity=None, attachAlgoOrds=None):
         if quantity is None:
             quantity = self.position_stock
         message = f"{side} {quantity} USDT {self.trade_config.inst}"
-        logger.debug("message %s" % message)
+        if attachAlgoOrds:
+            message += f" {attachAlgoOrds}"
+        logger.debug("message %s", message)
         if self.debug_config and self.debug_config.debug:
             with open(f"testdata/op-{self.id}", "a") as f:
                 f.write(message+"\n")
         else:
-            orderInfo = self.place_order(side, quantity)
-            logger.debug("order info %s" % orderInfo)
+            try:
+                orderInfo = self.place_order(side, quantity, attachAlgoOrds)
+            finally:
+                if self.recorder:
+                    # 下单前后的决策轨迹立即落盘, 崩溃时也能解释这笔交易
+                    self.recorder.flush()
+            logger.debug("order info %s", orderInfo)
             op = Operation()
             op.insid = self.trade_config.inst
             op.side = OperationType.BUY if side == "buy" else OperationType.SELL
             op.price = orderInfo.px
             op.quantity = orderInfo.sz
             op.available_balance = self.available_balance + float(orderInfo.sz) * float(orderInfo.px)
-            self.db.insert_operation(op)
+            self.persist(op)
 
         return orderInfo
 
+    def persist(self, op):
+        # 分阶段运行时会替换为写入持久化队列, 见 runtime.StagedRuntime
+        with stage("db"):
+            self.db.insert_operation(op)
+
         
 
 
-    def place_order(self, side, quantity): #side: buy or sell quantity=USDT
-        clOrderId = f"{side}%s" % datetime.now().strftime("%Y%m%d%H%M%S")
-        logger.info("place order %s %s %s %.8f" % (clOrderId, self.trade_config.inst, side, quantity))
+    def place_order(self, side, quantity, attachAlgoOrds=None): #side: buy or sell quantity=USDT
+        with stage("order"):
+            return self.submit_order(side, quantity, attachAlgoOrds)
+
+    def submit_order(self, side, quantity, attachAlgoOrds=None):
+        clOrderId = self.order_ids.next(side)
+        logger.info("place order %s %s %s %.8f", clOrderId, self.trade_config.inst, side, quantity)
         quantity_str = "%.8f" % quantity
-        result = self.restful_client.place_order(clOrderId, self.trade_config.inst, side, quantity_str)
-        logger.info("result %s" % result)
-        ordId = result['data'][0]['ordId']
+        result = self.restful_client.submit_order(clOrderId, self.trade_config.inst, side, quantity_str, attachAlgoOrds)
+        logger.info("result %s", result)
+        ordId = result['ordId']
 
         if not ordId:
-            logger.error("Failed to place order, error code: %s, error message: %s" % (result['data'][0]['sCode'], result['data'][0]['sMsg']))
+            logger.error("Failed to place order, error code: %s, error message: %s", result['sCode'], result['sMsg'])
             return None 
         
         order_info = self.restful_client.get_order(self.trade_config.inst, ordId = ordId, clOrdId = clOrderId)
         #logger.info("order info %s" % order_info)
         return OrderInfo.fromOrderData(order_info['data'][0])
 
+    def tpsl_orders(self, side, price):
+        """
+        开仓时附带的交易所端止盈止损单 (attachAlgoOrds), 触发价由 stop_loss_pct/take_profit_pct 和开仓价计算, 以市价平仓。
+        Returns None when attach_tpsl is off or neither percentage is configured.
+        """
+        if not self.trade_config.attach_tpsl:
+            return None
+        tp, sl = self.trade_config.take_profit_pct, self.trade_config.stop_loss_pct
+        if not tp and not sl:
+            return None
+        sign = 1 if side == "buy" else -1
+        algo = {'attachAlgoClOrdId': self.order_ids.next("tpsl")}
+        if tp:
+            algo['tpTriggerPx'] = "%.8g" % (price * (1 + sign * float(tp) / 100))
+            algo['tpOrdPx'] = "-1"
+        if sl:
+            algo['slTriggerPx'] = "%.8g" % (price * (1 - sign * float(sl) / 100))
+            algo['slOrdPx'] = "-1"
+        return [algo]
+
+    def tpsl_due(self):
+        return bool(self.in_position and self.tpsl_algo_id
+                    and time.monotonic() - self.tpsl_checked_at >= self.trade_config.tpsl_check_interval)
+
+    def reconcile_tpsl(self):
+        """If the exchange-side TP/SL of the open position has triggered, record the exit and go flat."""
+        self.tpsl_checked_at = time.monotonic()
+        if self.debug_config and self.debug_config.debug:
+            return
+        try:
+            algo = self.restful_client.get_algo_order(self.tpsl_algo_id)
+            if algo is None:
+                return
+            if algo['state'] == 'effective':
+                self.on_tpsl_triggered(algo)
+            elif algo['state'] in ('canceled', 'order_failed'):
+                logger.warning("Exchange-side TP/SL %s is %s, exits rely on pipelines only", self.tpsl_algo_id, algo['state'])
+                self.tpsl_algo_id = None
+        except Exception as e:
+            # 下一个检查周期再试
+            logger.error("Failed to check TP/SL %s: %s", self.tpsl_algo_id, e)
+
+    def on_tpsl_triggered(self, algo):
+        """Record the exit done by the exchange-side TP/SL and go flat."""
+        logger.info("Exchange-side %s of %s triggered, order %s", algo.get('actualSide') or 'TP/SL', self.tpsl_algo_id, algo.get('ordId'))
+        if algo.get('ordId'):
+            order = self.restful_client.get_order(self.trade_config.inst, ordId=algo['ordId'], clOrdId='')
+            if order.get('code') == '0' and order.get('data'):
+                orderInfo = OrderInfo.fromOrderData(order['data'][0])
+                op = Operation()
+                op.insid = self.trade_config.inst
+                op.side = OperationType.BUY if orderInfo.side == "buy" else OperationType.SELL
+                op.price = orderInfo.px
+                op.quantity = orderInfo.sz
+                op.available_balance = self.available_balance
+                self.persist(op)
+        self.in_position = None
+        self.position_stock = 0
+        self.entry_price = 0
+        self.tpsl_algo_id = None
+        self.journal_position()
+
+    def cancel_tpsl(self):
+        """
+        Cancel the attached TP/SL before the position is closed locally. Returns False when the position must not be
+        closed locally: the TP/SL has already closed it, or its state could not be determined (retried on the next exit).
+        """
+        if not self.tpsl_algo_id:
+            return True
+        if self.debug_config and self.debug_config.debug:
+            self.tpsl_algo_id = None
+            return True
+        algo = self.restful_client.get_algo_order(self.tpsl_algo_id)
+        if algo is None:
+            return False
+        if algo['state'] == 'effective':
+            # 上次检查之后已在交易所触发, 按触发处理, 不再本地平仓
+            self.on_tpsl_triggered(algo)
+            return False
+        if algo['state'] in ('live', 'pause', 'partially_effective'):
+            result = self.restful_client.cancel_algo_order(self.trade_config.inst, algo['algoId'])
+            if result.get('code') != '0':
+                # 可能正在触发, 保留 tpsl_algo_id 由 reconcile_tpsl 确认
+                logger.error("Failed to cancel TP/SL %s, error code: %s, error message: %s", self.tpsl_algo_id, result.get('code'), result.get('msg'))
+                return False
+        self.tpsl_algo_id = None
+        return True
+
     def get_account_balance(self):
         res = self.restful_client.accountAPI().get_account_balance()
         if res['code'] == '0':
             return res['data'][0]['details']
         else:
-            logger.error("Failed to get account balance, error code: %s, error message: %s" % (res['code'], res['msg']))
+            logger.error("Failed to get account balance, error code: %s, error message: %s", res['code'], res['msg'])
             return None
     
     def get_account_total_USD(self):
@@ -315,11 +707,13 @@ class AutoEarn(object):
             self.in_position = "long"
             logger.info("Opened long position")
             try:
-                orderInfo = self.operation("buy", buy_quantity)
+                tpsl = self.tpsl_orders("buy", current_close_price)
+                orderInfo = self.operation("buy", buy_quantity, tpsl)
                 self.position_stock = orderInfo.sz
                 self.entry_price = orderInfo.px
+                self.tpsl_algo_id = tpsl[0]['attachAlgoClOrdId'] if tpsl else None
             except Exception as e:
-                logger.error("Failed to open long position: %s" % e)
+                logger.error("Failed to open long position: %s", e)
                 return
 
         else: #in position and in short position
@@ -329,7 +723,7 @@ class AutoEarn(object):
                 self.position_stock = 0
                 self.entry_price = 0
             except Exception as e:
-                logger.error("Failed to close short position: %s" % e)
+                logger.error("Failed to close short position: %s", e)
                 return
             
             
@@ -352,11 +746,13 @@ class AutoEarn(object):
             self.in_position = "short"
             logger.info("Opened short position")
             try:
-                orderInfo = self.operation("sell", sell_quantity)
+                tpsl = self.tpsl_orders("sell", current_close_price)
+                orderInfo = self.operation("sell", sell_quantity, tpsl)
                 self.position_stock = orderInfo.sz
                 self.entry_price = orderInfo.px
+                self.tpsl_algo_id = tpsl[0]['attachAlgoClOrdId'] if tpsl else None
             except Exception as e:
-                logger.error("Failed to open short position: %s" % e)
+                logger.error("Failed to open short position: %s", e)
                 return
         else:
             logger.info("Closed long position in sell")
@@ -365,12 +761,19 @@ class AutoEarn(object):
                 self.position_stock = 0
                 self.entry_price = 0
             except Exception as e:
-                logger.error("Failed to close long position: %s" % e)
+                logger.error("Failed to close long position: %s", e)
                 return
 
         #self.operation(f"Sold {sell_quantity} stocks for {sell_amount:.4f}$. Remaining balance: {self.available_balance:.4f}, Position stock: {self.position_stock}, Price: {current_close_price}")
 
     def exitPosition(self):
+        try:
+            if not self.cancel_tpsl():
+                return
+        except Exception as e:
+            logger.error("Failed to cancel TP/SL, not closing the position locally: %s", e)
+            return
+
         if self.in_position == "short":  # Close short position
             # Calculate total cost to close short position
             logger.info("Closed short position")
@@ -380,7 +783,7 @@ class AutoEarn(object):
                 self.entry_price = 0
                 orderInfo = self.operation("buy", self.position_stock)
             except Exception as e:
-                logger.error("Failed to close short position: %s" % e)
+                logger.error("Failed to close short position: %s", e)
                 return
 
             #self.operation(f"Bought {self.position_stock} stocks for {buy_amount:.4f}$. Remaining balance: {self.available_balance:.4f}, Position stock: {self.position_stock}, Price: {current_close_price}")
@@ -394,7 +797,7 @@ class AutoEarn(object):
                 self.entry_price = 0
                 self.operation("sell", self.position_stock)
             except Exception as e:
-                logger.error("Failed to close long position: %s" % e)
+                logger.error("Failed to close long position: %s", e)
                 return
 
             #self.operation(f"Sold {self.position_stock} stocks for {sell_amount:.4f}$. Remaining balance: {self.available_balance:.4f}, Position stock: {self.position_stock}, Price: {current_close_price}")
@@ -405,19 +808,50 @@ class AutoEarn(object):
         return ca['data'][0]['details']
 
     def start(self):
+        if self.journal:
+            self.recover()
+        try:
+            self.run_feed()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.recorder:
+            self.recorder.close()
+        if self.journal:
+            self.journal.close()
+
+    def run_feed(self):
         #self.check_account()
 
-        if self.debug_config and self.debug_config.debug and self.debug_config.datafile:
-            logger.info("Reading data from file %s" % self.debug_config.datafile)
+        if self.replays_datafile:
+            logger.info("Reading data from file %s", self.debug_config.datafile)
             with open(self.debug_config.datafile, "r") as f:
                 for line in f:
                     self.parseData(line)
+        elif self.trade_config.bus:
+            from marketbus import MarketBusReader, bus_key, follow
+            logger.info("Reading candles from market bus %s", self.trade_config.bus)
+            reader = MarketBusReader(self.trade_config.bus, bus_key(self.trade_config.inst, self.trade_config.candle_interval))
+            try:
+                stale_after = self.feed_config.stale_after if self.feed_config and self.feed_config.enabled else None
+                follow(reader, lambda record: self.onCandle(Candle(*record)), stale_after=stale_after, on_stale=self.on_stale)
+            except KeyboardInterrupt:
+                logger.info("Received exit signal. Closing market bus reader...")
+            finally:
+                reader.close()
         else:
+            from wsclient import PublicClient
             puburl = "wss://wspap.okx.com:8443/ws/v5/business"
             args = {"channel": "index-candle%s" % self.trade_config.candle_interval, "instId": self.trade_config.inst}
             logger.info("Starting Connect Public WS...")
             logger.info("Parameters:\n%s", dict2str(args))
-            pub_client = PublicClient(puburl, [args], self.parseData)
+            if self.runtime_config and self.runtime_config.staged:
+                StagedRuntime(self, self.runtime_config).run(puburl, [args])
+                return
+            pub_client = PublicClient(puburl, [args], self.parseData, on_reconnect=self.on_reconnect,
+                                      watchdog=self.feed_watchdog(interval_to_ms(self.trade_config.candle_interval)), on_stale=self.on_stale)
+            self.start_book_feed()
             pub_client.run()
 
 
@@ -2,4 +2,20 @@ def dict2str(d):
     s = ""
     for k, v in d.items():
         s += f"{k}: {v}\n"
-    return s
\ No newline at end of file
+    return s
+
+
+INTERVAL_UNITS_MS = {
+    'm': 60 * 1000,
+    'H': 60 * 60 * 1000,
+    'D': 24 * 60 * 60 * 1000,
+    'W': 7 * 24 * 60 * 60 * 1000,
+}
+
+def interval_to_ms(interval):
+    """Convert an okx bar such as 1m/4H/1Dutc into milliseconds, None for bars without a fixed length (1M)."""
+    interval = interval.replace('utc', '')
+    unit = INTERVAL_UNITS_MS.get(interval[-1:])
+    if unit is None or not interval[:-1].isdigit():
+        return None
+    return int(interval[:-1]) * unit
@@ -0,0 +1,113 @@
+"""
+持仓状态日志: 仓位变化和已完成K线以追加方式写入 journal, 每隔一定条数写一次快照并清空 journal。
+进程崩溃重启后, 读取快照再重放 journal 即可恢复精确的仓位和K线窗口。
+
+Append-only state journal with periodic snapshots. Entries are JSON lines:
+    {"t": "pos", "available_balance": .., "in_position": .., "position_stock": .., "entry_price": .., "tpsl_algo_id": ..}
+    {"t": "candle", "c": [timestamp, open, high, low, close]}
+Snapshots are written to a temp file and renamed over the previous one, then the journal is truncated,
+so a crash at any point leaves either the old snapshot plus journal or the new snapshot.
+"""
+import json
+import os
+import threading
+from log import logger
+
+
+POSITION_FIELDS = ('available_balance', 'in_position', 'position_stock', 'entry_price', 'tpsl_algo_id')
+
+
+class StateJournal:
+
+    SNAPSHOT_INTERVAL = 1000
+    MAX_CANDLES = 31  # 与 AutoEarn.last_candles 的窗口一致
+
+    def __init__(self, dir, name, snapshot_interval=SNAPSHOT_INTERVAL, fsync=False):
+        os.makedirs(dir, exist_ok=True)
+        self.snapshot_path = os.path.join(dir, f"{name}.snapshot")
+        self.journal_path = os.path.join(dir, f"{name}.journal")
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+        self.entries = 0
+        self.state = {'candles': []}
+        self.file = None
+        self.lock = threading.Lock()  # 分阶段运行时决策阶段和执行阶段的线程都会写入
+
+    def recover(self):
+        """Rebuild the last persisted state, None when nothing was journaled yet."""
+        found = False
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                self.state = json.load(f)
+            found = True
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb+") as f:
+                valid = 0  # 最后一条完整记录的结束位置
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if entry is None:
+                        # 崩溃时写了一半的最后一行, 截掉, 否则之后追加的记录会接在半行后面一起无法解析
+                        logger.warning("Ignoring truncated journal entry in %s", self.journal_path)
+                        f.truncate(valid)
+                        break
+                    if not line.endswith(b"\n"):
+                        f.write(b"\n")  # 完整的记录只差换行
+                    self.apply(entry)
+                    self.entries += 1
+                    valid += len(line)
+                    found = True
+        return self.state if found else None
+
+    def apply(self, entry):
+        if entry['t'] == 'pos':
+            for field in POSITION_FIELDS:
+                self.state[field] = entry.get(field)
+        elif entry['t'] == 'candle':
+            candles = self.state['candles']
+            candles.append(entry['c'])
+            del candles[:-self.MAX_CANDLES]
+
+    def append(self, entry):
+        with self.lock:
+            self.apply(entry)
+            if self.file is None:
+                self.file = open(self.journal_path, "a")
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.entries += 1
+            if self.entries >= self.snapshot_interval:
+                self.snapshot()
+
+    def record_position(self, available_balance, in_position, position_stock, entry_price, tpsl_algo_id=None):
+        entry = {'t': 'pos', 'available_balance': available_balance, 'in_position': in_position,
+                 'position_stock': position_stock, 'entry_price': entry_price, 'tpsl_algo_id': tpsl_algo_id}
+        with self.lock:
+            if all(self.state.get(field) == entry[field] for field in POSITION_FIELDS):
+                return
+        self.append(entry)
+
+    def record_candle(self, candle):
+        self.append({'t': 'candle', 'c': [candle.timestamp, candle.open, candle.high, candle.low, candle.close]})
+
+    def snapshot(self):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.journal_path, "w")
+        self.entries = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -1,5 +1,109 @@
+"""
+日志: 交易线程只把 LogRecord 放进队列, 格式化和输出都在后台线程完成, 消息参数延迟到后台格式化。
+每条日志附带结构化字段(交易对 inst、K线时间戳 tick、profiler 阶段 stage), 用 set_log_fields 设置。
+每个 tick 都可能输出的日志用 tick_logger, 按消息模板限频, 被抑制的条数会在下一条输出时附上。
 
+Queue-based logging: the hot path enqueues the unformatted record, a QueueListener thread formats and writes it.
+"""
+import atexit
+import contextvars
+import datetime
+import decimal
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("autoearn")
\ No newline at end of file
+import profiler
+
+
+_fields = contextvars.ContextVar("log_fields", default={})
+
+
+def set_log_fields(**fields):
+    """Attach structured fields (e.g. inst, tick) to every record logged from the current context."""
+    _fields.set({**_fields.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    # 在调用方线程中执行, 只做字段拷贝, 不做格式化
+    def filter(self, record):
+        fields = _fields.get()
+        record.inst = fields.get('inst', '-')
+        record.tick = fields.get('tick', '-')
+        record.stage = profiler.current_stage() or '-'
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `burst` records per message template through every `interval` seconds."""
+
+    def __init__(self, burst=5, interval=60):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.windows = {}  # template -> [window start, count, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(record.msg)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                window = self.windows[record.msg] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            window[1] += 1
+            if window[1] > self.burst:
+                window[2] += 1
+                return False
+        return True
+
+
+# 入队后不会再改变的参数类型, 可以安全地延迟到后台线程格式化
+IMMUTABLE_ARGS = (str, int, float, bytes, bool, type(None), decimal.Decimal, datetime.date, datetime.time, datetime.timedelta)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # 默认实现会在调用方线程格式化消息, 这里原样入队, 由后台线程格式化。
+        # 参数中有可变对象(list、dict、Candle 等)时在调用方线程立即格式化, 否则输出的是之后被修改过的值
+        args = record.args
+        if args and (not isinstance(args, tuple) or not all(isinstance(arg, IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    def format(self, record):
+        s = super().format(record)
+        s += f" [inst={record.inst} tick={record.tick} stage={record.stage}]"
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            s += f" ({suppressed} similar messages suppressed)"
+        return s
+
+
+_queue = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler(sys.stderr)
+_stream_handler.setFormatter(StructuredFormatter("%(levelname)s:%(name)s:%(message)s"))
+_listener = logging.handlers.QueueListener(_queue, _stream_handler, respect_handler_level=True)
+
+_queue_handler = LazyQueueHandler(_queue)
+_queue_handler.addFilter(ContextFilter())
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_listener.start()
+atexit.register(_listener.stop)
+
+# okx SDK 的 WsPublic 以 INFO 级别输出收到的每一帧, 只保留警告和错误 (行情帧由 recordMessage 写入 testdata)
+logging.getLogger("WsPublic").setLevel(logging.WARNING)
+
+logger = logging.getLogger("autoearn")
+
+# 每个 tick 都可能输出的日志(pipeline 信号等), 同一模板每分钟最多输出5条
+tick_logger = logger.getChild("tick")
+tick_logger.addFilter(RateLimitFilter())
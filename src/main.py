@@ -1,8 +1,7 @@
-import asyncio
-import threading
-from autoearn import AutoEarn
 import argparse
-from webapp import create_app  # 新增导入
+
+# 各模式需要的重量级依赖 (okx, SQLAlchemy, Flask, websockets ...) 在对应的 start_* 中按需导入,
+# 保证 --help 以及 supervisor 等轻量模式的启动开销, 见 startup_check.py
 
 def main():
     parser = argparse.ArgumentParser(description="A script that reads a YAML configuration file.")
@@ -13,32 +12,85 @@ def main():
     parser.add_argument(
         '-w', '--web', 
         action='store_true', 
-        help="Start the Flask webapp."
+        help="Start the Flask webapp. Combined with -a it runs inside the AutoEarn process."
     )
     parser.add_argument(
         '-a', '--autorun', 
         action='store_true', 
         help="Start the AutoEarn process."
     )
+    parser.add_argument(
+        '-s', '--supervise',
+        nargs='+',
+        metavar='CONFIG',
+        help="Run every given config file (or every *.yaml in a given directory) in its own worker process."
+    )
+    parser.add_argument(
+        '-i', '--ingest',
+        action='store_true',
+        help="Start the market data ingest process publishing candles to the shared-memory bus."
+    )
+    parser.add_argument(
+        '-n', '--scan',
+        action='store_true',
+        help="Start the market scanner ranking every configured instrument into a shortlist file."
+    )
 
     args = parser.parse_args()
 
-    if args.web:
+    if args.web and args.autorun:
+        if not args.config:
+            parser.error("-a/--autorun requires -c/--config.")
+        start_webapp(background=True)
+        start_autoearn(args.config)
+    elif args.web:
         start_webapp()
     elif args.autorun:
         if not args.config:
             parser.error("-a/--autorun requires -c/--config.")
         start_autoearn(args.config)
+    elif args.ingest:
+        if not args.config:
+            parser.error("-i/--ingest requires -c/--config.")
+        start_ingest(args.config)
+    elif args.scan:
+        if not args.config:
+            parser.error("-n/--scan requires -c/--config.")
+        start_scanner(args.config)
+    elif args.supervise:
+        start_supervisor(args.supervise)
     else:
         parser.print_help()
 
 def start_autoearn(config_path):
+    from autoearn import AutoEarn
     autoearn = AutoEarn.from_config(config_path)
     autoearn.start()
 
-def start_webapp():
+def start_supervisor(paths):
+    from supervisor import Supervisor, collect_configs
+    supervisor = Supervisor(collect_configs(paths))
+    supervisor.run()
+
+def start_ingest(config_path):
+    from marketbus import MarketDataIngest
+    ingest = MarketDataIngest.from_config(config_path)
+    ingest.start()
+
+def start_scanner(config_path):
+    from scanner import MarketScanner
+    scanner = MarketScanner.from_config(config_path)
+    scanner.start()
+
+def start_webapp(background=False):
+    from webapp import create_app
     webapp = create_app()
-    webapp.run(host='0.0.0.0', port=5001)
+    if background:
+        # 与 AutoEarn 同进程运行, /profile 可以采样交易线程
+        import threading
+        threading.Thread(target=webapp.run, kwargs={'host': '0.0.0.0', 'port': 5001, 'use_reloader': False}, name="webapp", daemon=True).start()
+    else:
+        webapp.run(host='0.0.0.0', port=5001)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,224 @@
+"""
+共享内存行情总线: 一个 ingest 进程负责 WebSocket 订阅和 JSON 解析, 把解码后的K线写入共享内存环形缓冲区,
+同一台机器上的任意数量策略进程直接从共享内存读取, 不再各自建立连接、重复解析。
+
+Shared-memory market-data bus. One ingest process owns the websocket subscriptions, decodes each candle once
+and appends it to a ring buffer in shared memory; local strategy processes read from the ring by sequence number.
+
+Layout:
+    header: capacity(u64) write_seq(u64) epoch(u64), padded to 64 bytes
+    slots:  seq(u64) timestamp(i64) open high low close(f64) isfinish(bool) key(23s)
+
+The single writer clears a slot's seq, writes the payload, then publishes the slot seq and the header write_seq.
+Readers re-check the slot seq after unpacking, so a slot overwritten mid-read is detected instead of returned torn.
+A reader more than `capacity` records behind has been lapped; the skipped records are counted in `dropped`.
+
+A restarted ingest unlinks the old segment and creates a new one under the same name, which readers still mapping the
+old segment would never see. Each writer stamps a new epoch into the header and sets it to 0 on close; a reader
+re-opens the segment by name when its epoch reads 0 or the bus has been idle for REATTACH_INTERVAL seconds, and
+switches to it when the epoch differs.
+"""
+import json
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from log import logger
+
+
+HEADER = struct.Struct("<QQQ")
+HEADER_SIZE = 64
+SLOT = struct.Struct("<Qqdddd?23s")
+SEQ = struct.Struct("<Q")
+DEFAULT_CAPACITY = 65536
+EPOCH_OFFSET = 16
+CLOSED_EPOCH = 0
+
+
+def bus_key(inst, candle_interval):
+    return f"{inst}|{candle_interval}".encode()
+
+
+class MarketBusWriter:
+    def __init__(self, name, capacity=DEFAULT_CAPACITY):
+        size = HEADER_SIZE + SLOT.size * capacity
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 上一次 ingest 异常退出残留的共享内存, 重新创建以清空旧数据
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.capacity = capacity
+        self.write_seq = 0
+        self.epoch = time.time_ns()
+        HEADER.pack_into(self.buf, 0, capacity, 0, self.epoch)
+
+    def publish(self, key, timestamp, _open, high, low, close, isfinish):
+        seq = self.write_seq + 1
+        offset = HEADER_SIZE + ((seq - 1) % self.capacity) * SLOT.size
+        SEQ.pack_into(self.buf, offset, 0)
+        SLOT.pack_into(self.buf, offset, 0, timestamp, _open, high, low, close, isfinish, key)
+        SEQ.pack_into(self.buf, offset, seq)
+        SEQ.pack_into(self.buf, 8, seq)
+        self.write_seq = seq
+        return seq
+
+    def close(self):
+        # 通知仍映射着本段的读取方
+        SEQ.pack_into(self.buf, EPOCH_OFFSET, CLOSED_EPOCH)
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class MarketBusReader:
+
+    REATTACH_INTERVAL = 5  # 总线空闲或写入方已关闭时, 每隔该秒数检查是否有新的写入方
+
+    def __init__(self, name, key=None):
+        self.name = name
+        self.key = key
+        self.dropped = 0
+        self.reattach_count = 0
+        self.shm = None
+        self.attach(self.open())
+        self.read_seq = SEQ.unpack_from(self.buf, 8)[0]
+        self.last_record = time.monotonic()
+
+    def open(self):
+        shm = shared_memory.SharedMemory(name=self.name)
+        # 只读方不拥有共享内存, 避免 resource_tracker 在进程退出时把它删除
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    def attach(self, shm):
+        if self.shm is not None:
+            self.buf = None
+            self.shm.close()
+        self.shm = shm
+        self.buf = shm.buf
+        self.capacity, _, self.epoch = HEADER.unpack_from(self.buf, 0)
+        self.last_progress = self.checked_at = time.monotonic()
+
+    def check_writer(self):
+        """Switch to the current segment when the ingest process has restarted. Returns True when re-attached."""
+        self.checked_at = time.monotonic()
+        try:
+            shm = self.open()
+        except FileNotFoundError:
+            return False
+        epoch = SEQ.unpack_from(shm.buf, EPOCH_OFFSET)[0]
+        if epoch == self.epoch or epoch == CLOSED_EPOCH:
+            shm.close()
+            return False
+        self.attach(shm)
+        self.read_seq = 0  # 新的写入方从序号 0 开始, 读取它写入的全部记录
+        self.reattach_count += 1
+        logger.warning("Market bus %s writer restarted, re-attached (re-attaches: %d)", self.name, self.reattach_count)
+        return True
+
+    @property
+    def idle_seconds(self):
+        """Seconds since the last record for this reader's key."""
+        return time.monotonic() - self.last_record
+
+    def poll(self, limit=1024):
+        """Return up to `limit` new (timestamp, open, high, low, close, isfinish) records for this reader's key."""
+        write_seq = SEQ.unpack_from(self.buf, 8)[0]
+        if write_seq == self.read_seq:
+            now = time.monotonic()
+            closed = SEQ.unpack_from(self.buf, EPOCH_OFFSET)[0] == CLOSED_EPOCH
+            if (closed or now - self.last_progress >= self.REATTACH_INTERVAL) and now - self.checked_at >= self.REATTACH_INTERVAL:
+                if self.check_writer():
+                    write_seq = SEQ.unpack_from(self.buf, 8)[0]
+            if write_seq == self.read_seq:
+                return []
+        self.last_progress = time.monotonic()
+        if write_seq - self.read_seq > self.capacity:
+            lag = write_seq - self.read_seq - self.capacity
+            self.dropped += lag
+            self.read_seq += lag
+            logger.warning("Market bus reader lapped, dropped %d records (total %d)", lag, self.dropped)
+
+        records = []
+        while self.read_seq < write_seq and len(records) < limit:
+            seq = self.read_seq + 1
+            offset = HEADER_SIZE + ((seq - 1) % self.capacity) * SLOT.size
+            slot_seq, timestamp, _open, high, low, close, isfinish, key = SLOT.unpack_from(self.buf, offset)
+            if slot_seq != seq or SEQ.unpack_from(self.buf, offset)[0] != seq:
+                # 读取过程中被写入方覆盖
+                self.dropped += 1
+            elif self.key is None or key.rstrip(b"\0") == self.key:
+                records.append((timestamp, _open, high, low, close, isfinish))
+            self.read_seq = seq
+        if records:
+            self.last_record = self.last_progress
+        return records
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+
+class MarketDataIngest:
+    """Owns the websocket subscriptions for every configured instrument and publishes decoded candles to the bus."""
+
+    def __init__(self, name, subscriptions, capacity=DEFAULT_CAPACITY, url="wss://wspap.okx.com:8443/ws/v5/business"):
+        self.url = url
+        self.subscriptions = subscriptions  # [(inst, candle_interval)]
+        self.writer = MarketBusWriter(name, capacity)
+
+    def parseData(self, message):
+        parsed_data = json.loads(message)
+        if not parsed_data.get('data'):
+            return
+        arg = parsed_data['arg']
+        key = bus_key(arg['instId'], arg['channel'][len('index-candle'):])
+        for [timestamp, _open, high, low, close, isfinish] in parsed_data['data']:
+            self.writer.publish(key, int(timestamp), float(_open), float(high), float(low), float(close), isfinish == '1')
+
+    def start(self):
+        from wsclient import PublicClient
+        args = [{"channel": "index-candle%s" % interval, "instId": inst} for inst, interval in self.subscriptions]
+        logger.info("Starting market data ingest for %d subscriptions", len(args))
+        try:
+            PublicClient(self.url, args, self.parseData).run()
+        finally:
+            self.writer.close()
+
+    @staticmethod
+    def from_config(config_path):
+        import yaml
+        with open(config_path, 'r') as file:
+            config = yaml.safe_load(file)
+        bus_config = config.get("bus", {})
+        subscriptions = [(s["inst"], s.get("candle_interval", "5m")) for s in bus_config.get("subscriptions", [])]
+        return MarketDataIngest(bus_config.get("name", "autoearn"), subscriptions, bus_config.get("capacity", DEFAULT_CAPACITY))
+
+
+def follow(reader, callback, idle_sleep=0.005, stale_after=None, on_stale=None):
+    """
+    Feed every record for the reader's key to callback, sleeping briefly when the bus is idle.
+    When no record arrives for `stale_after` seconds on_stale(True, idle seconds) is called, and on_stale(False, 0)
+    once records flow again.
+    """
+    stale = False
+    while True:
+        records = reader.poll()
+        if not records:
+            if stale_after and not stale and reader.idle_seconds >= stale_after:
+                stale = True
+                logger.warning("No candles on market bus %s for %.1fs", reader.name, reader.idle_seconds)
+                if on_stale:
+                    on_stale(True, reader.idle_seconds)
+            time.sleep(idle_sleep)
+            continue
+        if stale:
+            stale = False
+            logger.info("Market bus %s recovered", reader.name)
+            if on_stale:
+                on_stale(False, 0)
+        for record in records:
+            callback(record)
@@ -0,0 +1,152 @@
+"""
+L2 订单簿: 订阅 books/books5 频道, 按价位增量维护买卖盘, 并用交易所下发的 checksum 和 seqId 校验完整性。
+买一/卖一、价差、中间价、总挂单量都是 O(1) 读取, 供 pipeline 通过 context.book 使用。
+
+Incremental L2 order book. Each side keeps a sorted list of float prices (best price at the end of the list)
+plus a dict price -> (price string, size string, size); the original strings are kept for the okx checksum,
+which is the CRC32 of the top 25 levels interleaved as "bidPx:bidSz:askPx:askSz:...".
+"""
+import bisect
+import zlib
+
+
+class BookSide:
+    __slots__ = ('descending', 'prices', 'levels', 'total_size')
+
+    def __init__(self, descending):
+        self.descending = descending   # bids: 价格从高到低为优
+        self.prices = []               # 升序存储 key, 最优价位在末尾
+        self.levels = {}               # key -> (px_str, sz_str, sz)
+        self.total_size = 0.0
+
+    def key(self, px):
+        return px if self.descending else -px
+
+    def clear(self):
+        self.prices.clear()
+        self.levels.clear()
+        self.total_size = 0.0
+
+    def update(self, px_str, sz_str):
+        px = float(px_str)
+        sz = float(sz_str)
+        key = self.key(px)
+        old = self.levels.get(key)
+        if old is not None:
+            self.total_size -= old[2]
+            if sz == 0:
+                del self.levels[key]
+                del self.prices[bisect.bisect_left(self.prices, key)]
+                return
+        elif sz == 0:
+            return
+        else:
+            bisect.insort(self.prices, key)
+        self.levels[key] = (px_str, sz_str, sz)
+        self.total_size += sz
+
+    @property
+    def best(self):
+        """(price, size) of the best level, None when empty."""
+        if not self.prices:
+            return None
+        level = self.levels[self.prices[-1]]
+        return float(level[0]), level[2]
+
+    def top(self, n):
+        """Raw (px_str, sz_str, sz) of the best n levels, best first."""
+        return [self.levels[key] for key in self.prices[:-n - 1:-1]]
+
+    def depth(self, n):
+        """Total size and notional of the best n levels."""
+        size = notional = 0.0
+        for px_str, _, sz in self.top(n):
+            size += sz
+            notional += sz * float(px_str)
+        return size, notional
+
+
+class OrderBook:
+
+    CHECKSUM_LEVELS = 25
+
+    def __init__(self):
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.seq_id = None
+        self.ts = 0
+        self.valid = False
+        self.updates = 0
+        self.checksum_failures = 0
+
+    def apply(self, action, data):
+        """
+        Apply a books/books5 push. Returns False when the book no longer matches the exchange
+        (sequence gap or checksum mismatch); the caller should resubscribe to get a fresh snapshot.
+        """
+        if action == 'snapshot':
+            self.bids.clear()
+            self.asks.clear()
+        elif not self.valid:
+            return False
+        elif data.get('prevSeqId') is not None and self.seq_id is not None and int(data['prevSeqId']) != self.seq_id:
+            self.valid = False
+            return False
+
+        for level in data.get('bids', ()):
+            self.bids.update(level[0], level[1])
+        for level in data.get('asks', ()):
+            self.asks.update(level[0], level[1])
+        if data.get('seqId') is not None:
+            self.seq_id = int(data['seqId'])
+        self.ts = int(data.get('ts', 0))
+        self.updates += 1
+
+        if data.get('checksum') is not None and self.checksum() != int(data['checksum']):
+            self.checksum_failures += 1
+            self.valid = False
+            return False
+        self.valid = True
+        return True
+
+    def checksum(self):
+        bids = self.bids.top(self.CHECKSUM_LEVELS)
+        asks = self.asks.top(self.CHECKSUM_LEVELS)
+        parts = []
+        for i in range(max(len(bids), len(asks))):
+            if i < len(bids):
+                parts.append(bids[i][0])
+                parts.append(bids[i][1])
+            if i < len(asks):
+                parts.append(asks[i][0])
+                parts.append(asks[i][1])
+        crc = zlib.crc32(":".join(parts).encode())
+        return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+    @property
+    def best_bid(self):
+        return self.bids.best
+
+    @property
+    def best_ask(self):
+        return self.asks.best
+
+    @property
+    def spread(self):
+        if not self.bids.prices or not self.asks.prices:
+            return None
+        return self.best_ask[0] - self.best_bid[0]
+
+    @property
+    def mid(self):
+        if not self.bids.prices or not self.asks.prices:
+            return None
+        return (self.best_ask[0] + self.best_bid[0]) / 2
+
+    @property
+    def spread_pct(self):
+        mid = self.mid
+        return self.spread / mid * 100 if mid else None
+
+    def __str__(self):
+        return f"OrderBook(bid={self.best_bid}, ask={self.best_ask}, spread={self.spread}, levels={len(self.bids.prices)}/{len(self.asks.prices)}, valid={self.valid})"
@@ -0,0 +1,50 @@
+"""
+客户端订单号(clOrdId)生成: okx 要求 1-32 位字母数字。
+格式为 side首字母 + 进程标识(6位) + 毫秒时间戳(8位) + 同一毫秒内的序号(4位), 均为 base62,
+进程标识由 pid 和随机数生成, 同一进程内单调递增, 不同进程、不同交易对之间不会重复。
+
+Process-unique, monotonic client order ids, e.g. "bnSgpa60vyv0Bz90003" (19 chars), ids of the same side sort in generation order within a process.
+"""
+import os
+import string
+import threading
+import time
+
+
+ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase  # ASCII 顺序, 生成的订单号按字典序递增
+
+
+def base62(value, width):
+    chars = []
+    for _ in range(width):
+        value, rem = divmod(value, 62)
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+class ClientOrderIdGenerator:
+
+    COUNTER_LIMIT = 62 ** 4
+
+    def __init__(self):
+        salt = int.from_bytes(os.urandom(4), "big")
+        self.process_tag = base62((os.getpid() << 32 | salt) % 62 ** 6, 6)
+        self.last_ms = 0
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next(self, side):
+        with self.lock:
+            now = time.time_ns() // 1000000
+            if now <= self.last_ms:
+                # 同一毫秒内或系统时钟回拨: 沿用上一个时间戳, 递增序号
+                now = self.last_ms
+                self.counter += 1
+                if self.counter == self.COUNTER_LIMIT:
+                    now += 1
+                    self.counter = 0
+            else:
+                self.counter = 0
+            self.last_ms = now
+            counter = self.counter
+        return f"{side[0]}{self.process_tag}{base62(now, 8)}{base62(counter, 4)}"
@@ -1,6 +1,7 @@
 
 from collections import defaultdict
-from log import logger
+from log import logger, tick_logger
+from profiler import stage
 
 class PipelineType:
     OPEN_ONLY = 'open'  # 开仓判断
@@ -9,8 +10,16 @@ class PipelineType:
 
 class ScorePipeline:
 
-    def log(self, message):
-        logger.info(f"{self.name}: {message}")
+    def log(self, message, *args):
+        tick_logger.info("%s: " + message, self.name, *args)
+
+    def process_batch(self, contexts):
+        """
+        Process many contexts in one call, used by CalculateScorePipeline.execute_batch.
+        Pipelines can override it with a vectorised implementation that leaves every context exactly as process() would.
+        """
+        for context in contexts:
+            self.process(context)
 
     def checktype(self, context):
         if self.type == PipelineType.OPEN_ONLY:
@@ -34,17 +43,20 @@ class PipelineContext:
                  current_candles: list,
                  in_position: str = None, 
                  position_stock: int = 0, 
-                 entry_price: float= 0.0):
+                 entry_price: float= 0.0,
+                 book = None):
         
         self.last_candles = last_candles        # 已完成的历史K线数据
         self.current_candles = current_candles  # 当前K线数据
         self.in_position = in_position          # 是否持仓，long(做多中) or short(做空中)
         self.position_stock = position_stock
         self.entry_price = entry_price
+        self.book = book                        # 订单簿(orderbook.OrderBook), 未订阅或未同步时为None
 
         self.score = 0                          # 评分，用于评估交易信号, 评分越高, 信号越强, 操作时的量也会随之增加
         self.operation = None                   # 操作，long(做多) or short(做空) or None(不操作)
         self.skip = False                       # 是否跳过pipeline，当有pipeline计算到特别重要的操作时，可以设置为True, 这样后续的pipeline就不会执行, 将直接进入操作 
+        self.contributions = {}                 # 每个执行过的pipeline对评分的贡献, key为pipeline的config_type
         
 
     def setSkipFlag(self):
@@ -104,7 +116,36 @@ class CalculateScorePipeline:
                 break
             p = pipeline()
             if p.checktype(context):
-                p.process(context)
+                score = context.score
+                with stage(p.name):
+                    p.process(context)
+                context.contributions[p.config_type] = context.score - score
+
+    def execute_batch(self, contexts):
+        """
+        批量评分: 每个 pipeline 只实例化一次, 对所有仍需执行的上下文调用一次 process_batch。
+        每个上下文的结果(score、operation、skip、contributions)与逐个调用 execute 完全一致。
+
+        Score many contexts (instruments, backtest scenarios) pipeline by pipeline instead of context by context.
+        """
+        contexts = list(contexts)
+        prepare = PreparePipeline()
+        for context in contexts:
+            prepare.process(context)
+        for pipeline in PipelineFactory.PIPELINES.values():
+            active = [context for context in contexts if not context.isSkip()]
+            if not active:
+                break
+            p = pipeline()
+            active = [context for context in active if p.checktype(context)]
+            if not active:
+                continue
+            scores = [context.score for context in active]
+            with stage(p.name):
+                p.process_batch(active)
+            for context, score in zip(active, scores):
+                context.contributions[p.config_type] = context.score - score
+        return contexts
         
 
 from .consecutive_candle import ConsecutiveCandlePipeline
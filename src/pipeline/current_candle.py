@@ -66,21 +66,21 @@ class CurrentCandlePipeline(ScorePipeline):
                     context.score = 1
                     context.operation = 'exit'
                     context.setSkipFlag()
-                    self.log("做多期间K线周期内涨幅达到设置的阀值 %.2f%%, 止盈获利:%.4f%%" % (self.long_take_profit_burst, total_profit))
+                    self.log("做多期间K线周期内涨幅达到设置的阀值 %.2f%%, 止盈获利:%.4f%%", self.long_take_profit_burst, total_profit)
                     return
                 
                 if total_profit >= self.long_take_profit:
                     context.score = 1
                     context.operation = 'exit'
                     context.setSkipFlag()
-                    self.log(f"做多期间达到设置的止盈值 %.2f%%, %.4f%%" % (self.long_take_profit, total_profit))
+                    self.log("做多期间达到设置的止盈值 %.2f%%, %.4f%%", self.long_take_profit, total_profit)
                     return
                 
                 if total_profit <= 0 - self.long_take_profit:
                     context.score = 1
                     context.operation = 'exit'
                     context.setSkipFlag()
-                    self.log(f"做多期间达到设置的止损值 %.2f%%, %.4f%%" % (self.long_take_profit, total_profit))
+                    self.log("做多期间达到设置的止损值 %.2f%%, %.4f%%", self.long_take_profit, total_profit)
                     return
 
             else:
@@ -90,31 +90,31 @@ class CurrentCandlePipeline(ScorePipeline):
                     context.score = 1
                     context.operation = 'exit'
                     context.setSkipFlag()
-                    self.log("做空期间K线周期内跌幅达到设置的阀值 %f%, 止盈获利:%.4f%" % (self.short_take_profit_burst, total_profit))
+                    self.log("做空期间K线周期内跌幅达到设置的阀值 %.2f%%, 止盈获利:%.4f%%", self.short_take_profit_burst, total_profit)
 
                 total_profit = (context.entry_price - last_current_candle.close)/context.entry_price
                 if total_profit >= self.short_take_profit:
                     context.score = 1
                     context.operation = 'exit'
                     context.setSkipFlag()
-                    self.log(f"做空期间达到设置的止盈值 %f%, %.4f%" % (self.short_take_profit, total_profit))
+                    self.log("做空期间达到设置的止盈值 %.2f%%, %.4f%%", self.short_take_profit, total_profit)
                     return
                 elif total_profit <= 0 - self.short_take_profit:
                     context.score = 1
                     context.operation = 'exit'
                     context.setSkipFlag()
-                    self.log(f"做空期间达到设置的止损值 %f%, %.4f%" % (self.short_take_profit, total_profit))
+                    self.log("做空期间达到设置的止损值 %.2f%%, %.4f%%", self.short_take_profit, total_profit)
                 
         else:
             if last_current_candle.color == 'green':
                 if last_current_candle.percent_change < -self.long_open:  # 绿色蜡烛，本周期内跌了 long_open% 买入做多
                     context.score += (abs(last_current_candle.percent_change) - self.long_open)
                     context.operation = 'long'
-                    self.log(f"Score update to {context.score} for increasing by {last_current_candle.percent_change}")
+                    self.log("Score update to %s for increasing by %s", context.score, last_current_candle.percent_change)
             else:
                 if last_current_candle.percent_change > self.short_open:  # 红色蜡烛，本周期内涨了 short_open% 开仓做空
                     context.score -= (last_current_candle.percent_change - self.short_open)
                     context.operation = 'short'
-                    self.log(f"Score update to {context.score} for decreasing by {last_current_candle.percent_change}")
+                    self.log("Score update to %s for decreasing by %s", context.score, last_current_candle.percent_change)
 
 
@@ -0,0 +1,80 @@
+"""
+按需采样分析器: 在运行中的进程里定时采集所有线程的调用栈, 输出 collapsed-stack 格式(可直接用 flamegraph.pl / speedscope 打开)。
+代码通过 stage() 标记当前所处阶段(parseData、各个 pipeline、下单、数据库), 采样结果以阶段名作为栈底。
+
+On-demand sampling profiler. A background thread reads sys._current_frames() every `interval` seconds while a
+profile is running, so nothing is paid when it is off apart from the stage() markers, which are a dict write each.
+
+    with stage("parseData"):
+        ...
+
+    collapsed = profile(seconds=10)   # "thread;stage:parseData;autoearn.py:parseData;... 42\n..."
+"""
+import collections
+import sys
+import threading
+import time
+
+
+MAX_SECONDS = 300
+
+_stages = {}  # thread id -> 当前阶段名
+_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class stage:
+    __slots__ = ('name', 'tid', 'previous')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self.previous = _stages.get(self.tid)
+        _stages[self.tid] = self.name
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.previous is None:
+            _stages.pop(self.tid, None)
+        else:
+            _stages[self.tid] = self.previous
+
+
+def current_stage():
+    return _stages.get(threading.get_ident())
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}"
+
+
+def profile(seconds=10, interval=0.005):
+    """Sample every other thread for `seconds` and return the stacks in collapsed format, most frequent first."""
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        me = threading.get_ident()
+        counts = collections.Counter()
+        deadline = time.monotonic() + min(seconds, MAX_SECONDS)
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append("stage:%s" % _stages.get(tid, "-"))
+                stack.append(names.get(tid, str(tid)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    finally:
+        _lock.release()
@@ -0,0 +1,65 @@
+"""
+客户端限频: 按 okx 各接口的限频规则为每个 (接口, 交易对) 维护一个令牌桶, 请求前先取令牌, 不足时等待,
+避免突发信号时触发交易所的限频错误再重试。
+
+Client-side token buckets, one per (endpoint, instrument) as okx counts most trading limits per instrument.
+"""
+import threading
+import time
+
+
+# endpoint -> (requests, per seconds), https://www.okx.com/docs-v5/en/#overview-rate-limits
+OKX_RATE_LIMITS = {
+    'place_order': (60, 2),
+    'batch_orders': (300, 2),     # 按订单数计
+    'get_order': (60, 2),
+    'cancel_algo_order': (20, 2),
+    'get_algo_order': (20, 2),
+    'index_candles': (20, 2),
+    'index_tickers': (20, 2),
+    'account_balance': (10, 2),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate            # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Take `tokens`, sleeping until they are available. Returns the seconds waited."""
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimiter:
+    def __init__(self, limits=OKX_RATE_LIMITS):
+        self.limits = limits
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, endpoint, key=None):
+        with self.lock:
+            bucket = self.buckets.get((endpoint, key))
+            if bucket is None:
+                count, seconds = self.limits[endpoint]
+                bucket = self.buckets[(endpoint, key)] = TokenBucket(count / seconds, count)
+            return bucket
+
+    def acquire(self, endpoint, key=None, tokens=1):
+        bucket = self.bucket(endpoint, key)
+        # 批量下单一次最多20个订单, 不会超过桶容量
+        return bucket.acquire(min(tokens, bucket.capacity))
@@ -1,5 +1,169 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from log import logger
-from okx import Account,TradingData,Trade
+from okx import Account,TradingData,Trade,MarketData
+from ratelimit import RateLimiter
+
+
+class OrderBatcher:
+    """
+    合并同时提交的订单: 后台线程每次取出队列中已有的全部订单(最多20个), 单个订单走普通下单接口,
+    多个订单合并为一次批量下单请求, 再按 clOrdId 把每个订单的结果交还给调用方。
+    不额外等待凑批, 请求进行中到达的订单会自然合并进下一批。
+
+    Coalesces orders submitted concurrently into okx batch-order calls and routes each order's result back.
+    """
+
+    MAX_BATCH = 20
+
+    def __init__(self, client):
+        self.client = client
+        self.orders = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, order):
+        future = Future()
+        self.orders.put((order, future))
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="order-batcher", daemon=True)
+                self.thread.start()
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.orders.get()]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self.orders.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.send(batch)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def send(self, batch):
+        if len(batch) == 1:
+            order, future = batch[0]
+            self.client.limiter.acquire('place_order', order['instId'])
+            future.set_result(self.client.tradeAPI().place_order(**order))
+            return
+
+        orders = [order for order, _ in batch]
+        for instId in {order['instId'] for order in orders}:
+            self.client.limiter.acquire('batch_orders', instId, sum(1 for order in orders if order['instId'] == instId))
+        logger.info("Placing %d orders in one batch", len(orders))
+        result = self.client.tradeAPI().place_multiple_orders(orders)
+        rows = {row.get('clOrdId'): row for row in result.get('data', [])}
+        for i, (order, future) in enumerate(batch):
+            row = rows.get(order['clOrdId'])
+            if row is None and i < len(result.get('data', [])):
+                row = result['data'][i]
+            if row is None:
+                future.set_result({'code': result.get('code'), 'msg': result.get('msg'), 'data': [{'ordId': '', 'clOrdId': order['clOrdId'], 'sCode': result.get('code'), 'sMsg': result.get('msg')}]})
+            else:
+                future.set_result({'code': '0' if row.get('sCode') == '0' else '1', 'msg': row.get('sMsg', ''), 'data': [row]})
+
+
+class OrderGateway:
+    """
+    进程间共享的下单入口: supervisor 进程中运行, 各 worker 进程的订单经同一个请求队列到达, 同一账户的订单交给同一个
+    OrderBatcher, 不同策略同时下的单可以合并为一次批量请求, 并共用该账户的限频桶。结果按请求 id 送回对应 worker 的应答队列。
+
+    Shared order submitter for the workers of a supervisor. Requests are (worker, request id, account, order),
+    account being (apikey, secretkey, passphrase, flag); replies are (request id, result, error message).
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.replies = {}   # worker -> 应答队列
+        self.clients = {}   # account -> RestfulClient
+        self.thread = None
+
+    def register(self, worker, replies):
+        self.replies[worker] = replies
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="order-gateway", daemon=True)
+        self.thread.start()
+
+    def client(self, account):
+        client = self.clients.get(account)
+        if client is None:
+            client = self.clients[account] = RestfulClient(*account)
+        return client
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            self.dispatch(*request)
+
+    def dispatch(self, worker, request_id, account, order):
+        # 只入队不等待结果, 下一个请求可以并入同一批
+        replies = self.replies.get(worker)
+        if replies is None:
+            logger.error("Order[%s] from unknown worker %s dropped", order.get('clOrdId'), worker)
+            return
+        try:
+            future = self.client(account).batcher.submit(order)
+        except Exception as e:
+            replies.put((request_id, None, str(e)))
+            return
+
+        def reply(future):
+            error = future.exception()
+            replies.put((request_id, None, str(error)) if error else (request_id, future.result(), None))
+        future.add_done_callback(reply)
+
+
+class RemoteOrderBatcher:
+    """
+    worker 端的 OrderBatcher 替身: submit 把订单发给 supervisor 中的 OrderGateway, 后台线程按请求 id 把应答交还给调用方。
+    Drop-in replacement for RestfulClient.batcher in supervised workers.
+    """
+
+    def __init__(self, worker, account, requests, replies):
+        self.worker = worker
+        self.account = account
+        self.requests = requests
+        self.replies = replies
+        self.ids = itertools.count()
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="order-replies", daemon=True)
+        self.thread.start()
+
+    def submit(self, order):
+        future = Future()
+        with self.lock:
+            request_id = next(self.ids)
+            self.futures[request_id] = future
+        self.requests.put((self.worker, request_id, self.account, order))
+        return future
+
+    def run(self):
+        while True:
+            request_id, result, error = self.replies.get()
+            with self.lock:
+                future = self.futures.pop(request_id, None)
+            if future is None:
+                continue  # 调用方已超时放弃
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+
+
+class OrderUnresolved(RuntimeError):
+    """Placing an order failed and its state could not be looked up, so it may or may not exist."""
 
 
 class RestfulClient:
@@ -9,11 +173,18 @@ class RestfulClient:
         self.secretkey = secretkey
         self.passphrase = passphrase
         self.flag = flag
-        logger.info(f"Creating RestfulClient with apikey: {apikey}, secretkey: {secretkey}, passphrase: {passphrase}, flag: {flag}")
+        logger.info("Creating RestfulClient with apikey: %s, secretkey: %s, passphrase: %s, flag: %s", apikey, secretkey, passphrase, flag)
 
         self.AccountAPI = None
         self.TradingDataAPI = None
         self.TradeApi = None
+        self.MarketAPI = None
+        self.limiter = RateLimiter()
+        self.batcher = OrderBatcher(self)  # supervisor 下替换为 RemoteOrderBatcher, 与其它 worker 共享批量下单
+
+    @property
+    def account(self):
+        return (self.apikey, self.secretkey, self.passphrase, self.flag)
 
     def tradeDataAPI(self):
         if self.TradingDataAPI is None:
@@ -33,20 +204,108 @@ class RestfulClient:
         return self.TradeApi
     
 
+    def marketAPI(self):
+        if self.MarketAPI is None:
+            self.MarketAPI = MarketData.MarketAPI(flag=self.flag, debug=False)
+        return self.MarketAPI
+
+
     def place_order(self, orderId, instId, side, sz, attachAlgoOrds=None):
-        logger.info(f"Placing order[{orderId}] for {sz} {instId} {side}")
-        result = self.tradeAPI().place_order(
-            clOrdId=orderId,
-            instId=instId, 
-            side=side, 
-            sz="%s" % sz,
-            tdMode="cash", 
-            ordType="market")
-        return result
+        """Place a market order; orders placed concurrently from other threads go out in one batch request."""
+        logger.info("Placing order[%s] for %s %s %s", orderId, sz, instId, side)
+        order = {
+            'clOrdId': orderId,
+            'instId': instId,
+            'side': side,
+            'sz': "%s" % sz,
+            'tdMode': "cash",
+            'ordType': "market",
+        }
+        if attachAlgoOrds:
+            order['attachAlgoOrds'] = attachAlgoOrds
+        # 超时按请求异常处理, submit_order 会先按 clOrdId 查询订单
+        return self.batcher.submit(order).result(self.ORDER_TIMEOUT)
     
+    ORDER_TIMEOUT = 30
+    DUPLICATED_CLORDID = '51016'
+    ORDER_NOT_EXIST = '51603'
+    LOOKUP_ATTEMPTS = 5
+    LOOKUP_DELAY = 1
+
+    def submit_order(self, clOrdId, instId, side, sz, attachAlgoOrds=None, retries=3):
+        """
+        幂等下单: 请求超时或异常时先按 clOrdId 查询订单, 已存在则直接返回, 交易所明确返回订单不存在(51603)时才用同一个 clOrdId 重试。
+        交易所只在订单未完成时拒绝重复的 clOrdId, 已成交的市价单不再拦截, 所以不能依赖它去重;
+        查询本身失败时订单状态未知, 抛出 OrderUnresolved 而不是重新下单。
+        Returns the placement row ({'ordId', 'clOrdId', 'sCode', 'sMsg'}) of the single order for clOrdId.
+        """
+        for attempt in range(retries):
+            try:
+                result = self.place_order(clOrdId, instId, side, sz, attachAlgoOrds)
+            except Exception as e:
+                logger.error("Placing order[%s] failed (attempt %d/%d): %s", clOrdId, attempt + 1, retries, e)
+                row = self.find_order(instId, clOrdId)
+                if row is not None:
+                    return row
+                continue
+            row = result['data'][0]
+            if row.get('sCode') == self.DUPLICATED_CLORDID:
+                # 上一次请求其实已经送达
+                return self.find_order(instId, clOrdId) or row
+            return row
+        raise RuntimeError(f"Failed to place order[{clOrdId}] after {retries} attempts")
+
+    def find_order(self, instId, clOrdId):
+        """
+        Placement row of an existing order looked up by clOrdId, None only when the exchange answers that it does not
+        exist. Failed lookups are retried; OrderUnresolved is raised when the order's state still cannot be determined.
+        """
+        for attempt in range(self.LOOKUP_ATTEMPTS):
+            # 超时的下单请求可能还在途中, 稍等再查
+            time.sleep(self.LOOKUP_DELAY)
+            try:
+                result = self.get_order(instId, ordId='', clOrdId=clOrdId)
+            except Exception as e:
+                logger.error("Looking up order[%s] failed (attempt %d/%d): %s", clOrdId, attempt + 1, self.LOOKUP_ATTEMPTS, e)
+                continue
+            if result.get('code') == '0' and result.get('data'):
+                order = result['data'][0]
+                logger.info("Reconciled order[%s] as ordId %s", clOrdId, order['ordId'])
+                return {'ordId': order['ordId'], 'clOrdId': clOrdId, 'sCode': '0', 'sMsg': ''}
+            if result.get('code') == self.ORDER_NOT_EXIST:
+                return None
+            logger.error("Looking up order[%s] failed, error code: %s, error message: %s", clOrdId, result.get('code'), result.get('msg'))
+        raise OrderUnresolved(f"State of order[{clOrdId}] is unknown after {self.LOOKUP_ATTEMPTS} lookups, not placing it again")
+
     def get_order(self, instId, ordId, clOrdId):
+        self.limiter.acquire('get_order', instId)
         result = self.tradeAPI().get_order(instId, ordId = ordId, clOrdId=clOrdId)
         return result
+
+    def get_algo_order(self, algoClOrdId):
+        """Details of an algo order (e.g. an attached TP/SL) by its client id, None when the lookup fails."""
+        self.limiter.acquire('get_algo_order')
+        result = self.tradeAPI().get_algo_order_details(algoClOrdId=algoClOrdId)
+        if result.get('code') != '0' or not result.get('data'):
+            logger.error("Failed to get algo order %s, error code: %s, error message: %s", algoClOrdId, result.get('code'), result.get('msg'))
+            return None
+        return result['data'][0]
+
+    def cancel_algo_order(self, instId, algoId):
+        self.limiter.acquire('cancel_algo_order', instId)
+        result = self.tradeAPI().cancel_algo_order([{'instId': instId, 'algoId': algoId}])
+        return result
+
+    def get_index_candles(self, instId, bar, after='', before='', limit=100):
+        """Index candles between `before` and `after` (both exclusive, ms), newest first."""
+        self.limiter.acquire('index_candles')
+        result = self.marketAPI().get_index_candlesticks(instId, after="%s" % after, before="%s" % before, bar=bar, limit="%s" % limit)
+        return result
+
+    def get_index_tickers(self, quoteCcy):
+        """Every index quoted in `quoteCcy`, e.g. all *-USDT indices."""
+        self.limiter.acquire('index_tickers')
+        return self.marketAPI().get_index_tickers(quoteCcy=quoteCcy)
         
 
     def close(self):
@@ -59,6 +318,9 @@ class RestfulClient:
         if self.TradingDataAPI is not None:
             self.TradingDataAPI.close()
 
+        if self.MarketAPI is not None:
+            self.MarketAPI.close()
+
 
     def __del__(self):
         self.close()
@@ -0,0 +1,205 @@
+"""
+分阶段异步运行: 行情接收(ingest)、决策(decision)、下单(execute)、持久化(persist) 四个阶段,
+阶段之间用有界队列连接, 每个阶段有自己的并发数, 慢的阶段只会让自己的队列堆积, 不会阻塞行情接收。
+
+Staged asyncio runtime for AutoEarn.
+
+    ingest   websocket callback on the event loop: decodes the message and queues the candle, never blocks.
+             When the decision queue is full, unfinished candle updates are dropped (the next update supersedes
+             them); finished candles and reconnects wait in a FIFO that is drained in order, and updates arriving
+             while it is not empty are dropped too, so nothing overtakes a finished candle.
+    decision single task, owns the candle window and scoring; only the REST backfill runs in a worker thread, the
+             candle window is modified on the event loop. While an order is in flight no new decisions are
+             made, since they would be based on a position that is about to change.
+    execute  runs AutoEarn.applyDecision (REST orders) and the journal write in worker threads.
+    persist  writes Operation rows to the database in worker threads.
+"""
+import asyncio
+import collections
+import json
+import time
+from common import interval_to_ms
+from log import logger
+from profiler import stage
+
+
+class RuntimeConfig:
+    def __init__(self, staged=False, decision_queue=1024, execute_queue=16, persist_queue=1024, persist_workers=2, stats_interval=60):
+        self.staged = staged
+        self.decision_queue = decision_queue
+        self.execute_queue = execute_queue
+        self.persist_queue = persist_queue
+        self.persist_workers = persist_workers
+        self.stats_interval = stats_interval
+
+
+class StageStats:
+    def __init__(self, name, queue):
+        self.name = name
+        self.queue = queue
+        self.processed = 0
+        self.dropped = 0
+        self.busy_seconds = 0
+
+    def __str__(self):
+        return f"{self.name}(queued={self.queue.qsize()}/{self.queue.maxsize}, processed={self.processed}, dropped={self.dropped}, busy={self.busy_seconds:.3f}s)"
+
+
+class StagedRuntime:
+
+    CANDLE = 'candle'
+    RECONNECT = 'reconnect'
+
+    def __init__(self, autoearn, config: RuntimeConfig):
+        from autoearn import Candle  # autoearn 导入了本模块, 这里延迟导入避免循环
+        self.Candle = Candle
+        self.autoearn = autoearn
+        self.config = config
+        self.loop = None
+        self.decision_queue = asyncio.Queue(config.decision_queue)
+        self.execute_queue = asyncio.Queue(config.execute_queue)
+        self.persist_queue = asyncio.Queue(config.persist_queue)
+        self.decision_stats = StageStats("decision", self.decision_queue)
+        self.execute_stats = StageStats("execute", self.execute_queue)
+        self.persist_stats = StageStats("persist", self.persist_queue)
+        self.pending = collections.deque()  # 决策队列满时等待入队的已完成K线和重连事件, 按到达顺序
+        self.drainer = None
+        self.executing = False
+        self.skipped_decisions = 0  # 下单进行中或行情过期时被跳过的决策次数
+
+    # ingest stage
+    def ingest(self, message):
+        with stage("parseData"):
+            self.decode(message)
+
+    def decode(self, message):
+        self.autoearn.recordMessage(message)
+        parsed_data = json.loads(message)
+        if not parsed_data.get('data'):
+            return
+        candle = self.Candle.from_data(parsed_data['data'][0])
+        self.enqueue((self.CANDLE, candle), keep=candle.isfinish)
+
+    def on_reconnect(self, downtime):
+        self.enqueue((self.RECONNECT, downtime), keep=True)
+
+    def enqueue(self, item, keep):
+        if not self.pending:
+            try:
+                self.decision_queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                pass
+        if keep:
+            self.pending.append(item)
+            if self.drainer is None:
+                self.drainer = self.loop.create_task(self.drain())
+        else:
+            self.decision_stats.dropped += 1
+
+    async def drain(self):
+        try:
+            while self.pending:
+                await self.decision_queue.put(self.pending[0])
+                self.pending.popleft()
+        finally:
+            self.drainer = None
+
+    # decision stage
+    async def decide(self):
+        while True:
+            kind, payload = await self.decision_queue.get()
+            started = time.perf_counter()
+            try:
+                await self.decide_one(kind, payload)
+            except Exception as e:
+                # 单条K线处理失败不能结束决策阶段
+                logger.error("Failed to process %s %s: %s", kind, payload, e)
+            self.decision_stats.processed += 1
+            self.decision_stats.busy_seconds += time.perf_counter() - started
+
+    async def decide_one(self, kind, payload):
+        # K线窗口只在事件循环上修改, 线程中只做 REST 补齐, 避免与执行阶段的 applyDecision 并发修改
+        if kind == self.RECONNECT:
+            missing = await asyncio.to_thread(self.autoearn.fetch_missing_candles)
+            self.autoearn.on_reconnect(payload, missing)
+        elif payload.isfinish:
+            missing = []
+            if not (self.autoearn.debug_config and self.autoearn.debug_config.debug):
+                missing = await asyncio.to_thread(self.autoearn.fetch_missing_candles, payload.timestamp)
+            self.autoearn.updateCandles(payload, missing)
+        else:
+            self.autoearn.updateCandles(payload)
+
+        if kind == self.CANDLE:
+            if not self.executing and self.autoearn.tpsl_due():
+                await asyncio.to_thread(self.autoearn.reconcile_tpsl)
+            if self.executing or self.autoearn.paused:
+                self.skipped_decisions += 1
+            else:
+                op, score = self.autoearn.calculateScore()
+                if op:
+                    self.executing = True
+                    await self.execute_queue.put((op, score))
+
+    # execute stage
+    def apply(self, op, score):
+        # 在工作线程中执行, journal 写文件(可能 fsync)不占用事件循环
+        self.autoearn.applyDecision(op, score)
+        self.autoearn.journal_position()
+
+    async def execute(self):
+        while True:
+            op, score = await self.execute_queue.get()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.apply, op, score)
+            except Exception as e:
+                logger.error("Failed to execute decision %s: %s", op, e)
+            finally:
+                self.executing = False
+            self.execute_stats.processed += 1
+            self.execute_stats.busy_seconds += time.perf_counter() - started
+
+    # persist stage
+    def enqueue_persist(self, op):
+        """Called from the execute worker thread; waits while the persist queue is full."""
+        asyncio.run_coroutine_threadsafe(self.persist_queue.put(op), self.loop).result()
+
+    def insert_operation(self, op):
+        with stage("db"):
+            self.autoearn.db.insert_operation(op)
+
+    async def persist(self):
+        while True:
+            op = await self.persist_queue.get()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.insert_operation, op)
+            except Exception as e:
+                logger.error("Failed to persist operation: %s", e)
+            self.persist_stats.processed += 1
+            self.persist_stats.busy_seconds += time.perf_counter() - started
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.config.stats_interval)
+            logger.info("Runtime stages: %s, %s, %s, pending=%d, skipped decisions=%d", self.decision_stats,
+                        self.execute_stats, self.persist_stats, len(self.pending), self.skipped_decisions)
+
+    def start_stages(self):
+        self.autoearn.persist = self.enqueue_persist
+        tasks = [self.decide(), self.execute(), self.report()]
+        tasks += [self.persist() for _ in range(self.config.persist_workers)]
+        for task in tasks:
+            self.loop.create_task(task)
+
+    def run(self, url, subscriptions):
+        from wsclient import PublicClient
+        client = PublicClient(url, subscriptions, self.ingest, on_reconnect=self.on_reconnect,
+                              watchdog=self.autoearn.feed_watchdog(interval_to_ms(self.autoearn.trade_config.candle_interval)),
+                              on_stale=self.autoearn.on_stale)
+        self.loop = client.loop
+        self.start_stages()
+        self.autoearn.start_book_feed()
+        client.run()
@@ -0,0 +1,270 @@
+"""
+市场扫描: 一个进程订阅数百个交易对的K线, 所有交易对的K线窗口保存在 numpy 数组中, 每次更新后用数组运算一次性计算
+consecutive_candle 和 current_candle 两个信号, 按评分排序后把候选名单原子写入 JSON 文件, 供交易实例选择交易对。
+
+Vectorised market scanner. Instead of one AutoEarn per pair, the finished candles of every instrument live in
+(instruments x WINDOW) arrays, oldest first and NaN until filled, and the latest unfinished candle in two vectors.
+After a reconnect the finished candles missed while disconnected are fetched over REST and spliced in by timestamp.
+Scoring all instruments is a handful of array operations (well under a millisecond for a few hundred pairs).
+Thresholds come from the pipeline instances, so scores equal what CalculateScorePipeline gives an instance
+without a position.
+
+Shortlist file:
+    {"timestamp": ms, "candle_interval": "5m", "instruments": 312,
+     "shortlist": [{"inst": "SOL-USDT", "operation": "long", "score": 4.1, "consecutive": 5, "change": 3.7}, ...]}
+"""
+import asyncio
+import json
+import os
+import time
+import numpy as np
+from log import logger
+from pipeline import ConsecutiveCandlePipeline, CurrentCandlePipeline
+
+
+WINDOW = 30  # 与 AutoEarn.last_candles 的窗口一致
+OPERATIONS = {1: 'long', -1: 'short'}
+
+
+class MarketScanner:
+
+    def __init__(self, insts, candle_interval='5m', output='shortlist.json', top=10, publish_interval=5,
+                 url="wss://wspap.okx.com:8443/ws/v5/business", restful_client=None, watchdog=None):
+        self.insts = list(insts)
+        self.index = {inst: i for i, inst in enumerate(self.insts)}
+        self.candle_interval = candle_interval
+        self.output = output
+        self.top = top
+        self.publish_interval = publish_interval
+        self.url = url
+        self.restful_client = restful_client  # 用于预热和重连后回补K线
+        self.watchdog = watchdog
+        self.client = None
+
+        n = len(self.insts)
+        self.opens = np.full((n, WINDOW), np.nan)
+        self.closes = np.full((n, WINDOW), np.nan)
+        self.ts = np.zeros((n, WINDOW), dtype=np.int64)  # 每根已完成K线的开始时间, 0 表示空位
+        self.cur_open = np.full(n, np.nan)
+        self.cur_close = np.full(n, np.nan)
+
+        consecutive = ConsecutiveCandlePipeline()
+        current = CurrentCandlePipeline()
+        self.min_consecutive = consecutive.cumulative_candle_count
+        self.long_open = current.long_open
+        self.short_open = current.short_open
+
+        self.shortlist = None
+        self.published_at = 0
+        self.updates = 0
+        self.reconnect_count = 0
+        self.backfill_task = None
+        self.backfill_requested = False
+
+    def update(self, inst, timestamp, _open, close, isfinish):
+        i = self.index.get(inst)
+        if i is None:
+            return
+        if isfinish:
+            if timestamp <= self.ts[i, -1]:
+                return  # 重复推送或回补过的K线
+            self.ts[i, :-1] = self.ts[i, 1:]
+            self.opens[i, :-1] = self.opens[i, 1:]
+            self.closes[i, :-1] = self.closes[i, 1:]
+            self.ts[i, -1] = timestamp
+            self.opens[i, -1] = _open
+            self.closes[i, -1] = close
+            self.cur_open[i] = self.cur_close[i] = np.nan
+        else:
+            self.cur_open[i] = _open
+            self.cur_close[i] = close
+        self.updates += 1
+
+    def score(self):
+        """
+        Score every instrument at once. Returns (score, operation, consecutive, change) arrays,
+        operation is 1 for long, -1 for short and 0 for no signal.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # consecutive_candle: 从倒数第二根开始往前, 与最后一根颜色相反(含十字星)的连续K线数量和累计涨跌幅
+            diff = self.closes - self.opens
+            last = diff[:, -1:]
+            prev = diff[:, -2::-1]
+            opposite = ((last > 0) & (prev <= 0)) | ((last < 0) & (prev >= 0))
+            run = np.logical_and.accumulate(opposite, axis=1)
+            consecutive = run.sum(axis=1)
+            pct = np.abs(diff / self.opens * 100)[:, -2::-1]
+            change = np.cumsum(np.where(run, pct, 0.0), axis=1)[:, -1]
+
+            fired = consecutive >= self.min_consecutive
+            score = np.where(fired, (consecutive - self.min_consecutive) * 0.2 + change, 0.0)
+            operation = fired.astype(np.int8)
+
+            # current_candle (未持仓分支): NaN 表示当前周期还没有推送
+            current_pct = (self.cur_close - self.cur_open) / self.cur_open * 100
+            green = self.cur_close > self.cur_open
+            long = green & (current_pct < -self.long_open)
+            short = ~green & (current_pct > self.short_open)
+            score = score + np.where(long, np.abs(current_pct) - self.long_open, 0.0)
+            score = score - np.where(short, current_pct - self.short_open, 0.0)
+            operation = np.where(long, 1, np.where(short, -1, operation))
+        return score, operation, consecutive, change
+
+    def rank(self):
+        score, operation, consecutive, change = self.score()
+        candidates = np.flatnonzero(operation)
+        order = candidates[np.argsort(-np.abs(score[candidates]), kind='stable')][:self.top]
+        return [{'inst': self.insts[i], 'operation': OPERATIONS[int(operation[i])], 'score': round(float(score[i]), 4),
+                 'consecutive': int(consecutive[i]), 'change': round(float(change[i]), 4)} for i in order]
+
+    def publish(self, shortlist):
+        data = {'timestamp': int(time.time() * 1000), 'candle_interval': self.candle_interval,
+                'instruments': len(self.insts), 'shortlist': shortlist}
+        tmp_path = self.output + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.output)
+        self.shortlist = shortlist
+        self.published_at = time.monotonic()
+
+    @staticmethod
+    def ranking(shortlist):
+        return None if shortlist is None else [(s['inst'], s['operation']) for s in shortlist]
+
+    def refresh(self):
+        """
+        Re-rank and publish immediately when the members, their order or direction changed; score changes alone
+        are published at most every publish_interval seconds, so unfinished candle pushes don't rewrite the file.
+        """
+        shortlist = self.rank()
+        changed = self.ranking(shortlist) != self.ranking(self.shortlist)
+        if changed or time.monotonic() - self.published_at >= self.publish_interval:
+            if changed:
+                logger.info("Shortlist: %s", ", ".join("%s(%s %.2f)" % (s['inst'], s['operation'], s['score']) for s in shortlist) or "-")
+            self.publish(shortlist)
+
+    def parseData(self, message):
+        parsed_data = json.loads(message)
+        if not parsed_data.get('data'):
+            return
+        inst = parsed_data['arg']['instId']
+        for [timestamp, _open, high, low, close, isfinish] in parsed_data['data']:
+            self.update(inst, int(timestamp), float(_open), float(close), isfinish == '1')
+        self.refresh()
+
+    def fetch_candles(self):
+        """
+        Fetch the latest finished candles of every instrument over REST. Blocking (rate limited), returns
+        {inst: [(timestamp, open, close), ...]} without touching the arrays.
+        """
+        fetched = {}
+        for inst in self.insts:
+            try:
+                result = self.restful_client.get_index_candles(inst, self.candle_interval, limit=WINDOW + 1)
+            except Exception as e:
+                logger.error("Failed to fetch candles of %s: %s", inst, e)
+                continue
+            if result.get('code') != '0':
+                logger.error("Failed to fetch candles of %s, error code: %s, error message: %s", inst, result.get('code'), result.get('msg'))
+                continue
+            fetched[inst] = [(int(row[0]), float(row[1]), float(row[4])) for row in result['data'] if row[5] == '1']
+        return fetched
+
+    def splice(self, inst, candles):
+        """Merge fetched finished candles into the window of `inst` by timestamp, keeping the newest WINDOW."""
+        i = self.index.get(inst)
+        if i is None or not candles:
+            return
+        merged = {int(ts): (o, c) for ts, o, c in zip(self.ts[i], self.opens[i], self.closes[i]) if ts}
+        for ts, o, c in candles:
+            merged[ts] = (o, c)
+        keep = sorted(merged)[-WINDOW:]
+        self.ts[i] = 0
+        self.opens[i] = self.closes[i] = np.nan
+        start = WINDOW - len(keep)
+        for j, ts in enumerate(keep, start):
+            self.ts[i, j] = ts
+            self.opens[i, j], self.closes[i, j] = merged[ts]
+
+    def warmup(self):
+        """Load the finished candles of every instrument over REST so signals are available from the first push."""
+        started = time.monotonic()
+        for inst, candles in self.fetch_candles().items():
+            self.splice(inst, candles)
+        logger.info("Warmed up %d instruments in %.1fs", len(self.insts), time.monotonic() - started)
+
+    def on_reconnect(self, downtime):
+        self.reconnect_count += 1
+        logger.info("Scanner feed reconnected after %.2fs, reconnects: %d", downtime, self.reconnect_count)
+        # 断线前未完成的K线已经过时, 等待新的推送
+        self.cur_open[:] = np.nan
+        self.cur_close[:] = np.nan
+        if self.restful_client is None:
+            logger.warning("No REST client, candles missed while disconnected are not backfilled")
+        elif self.backfill_task is not None:
+            self.backfill_requested = True  # 回补进行中, 结束后再补一次
+        else:
+            self.backfill_task = self.client.spawn(self.backfill())
+
+    async def backfill(self):
+        """Fetch in a worker thread, splice on the event loop so the arrays are only touched by the loop."""
+        try:
+            while True:
+                self.backfill_requested = False
+                started = time.monotonic()
+                fetched = await asyncio.to_thread(self.fetch_candles)
+                for inst, candles in fetched.items():
+                    self.splice(inst, candles)
+                logger.info("Backfilled %d/%d instruments in %.1fs", len(fetched), len(self.insts), time.monotonic() - started)
+                self.refresh()
+                if not self.backfill_requested:
+                    break
+        finally:
+            self.backfill_task = None
+
+    def start(self):
+        from wsclient import PublicClient
+        args = [{"channel": "index-candle%s" % self.candle_interval, "instId": inst} for inst in self.insts]
+        logger.info("Starting market scanner for %d instruments, shortlist at %s", len(args), self.output)
+        self.refresh()
+        self.client = PublicClient(self.url, args, self.parseData, on_reconnect=self.on_reconnect, watchdog=self.watchdog)
+        try:
+            self.client.run()
+        finally:
+            if self.restful_client is not None:
+                self.restful_client.close()
+
+    @staticmethod
+    def from_config(config_path):
+        import yaml
+        from common import interval_to_ms
+        from restfulclient import RestfulClient
+        from wsclient import FeedWatchdog
+        with open(config_path, 'r') as file:
+            config = yaml.safe_load(file)
+        scanner_config = config.get("scanner", {})
+        account_config = config.get("account", {})
+        feed_config = config.get("feed", {})
+        # 行情接口无需签名
+        restful_client = RestfulClient('', '', '', str(account_config.get('flag', '1')))
+
+        insts = scanner_config.get("insts")
+        if not insts:
+            quote = scanner_config.get("quote", "USDT")
+            result = restful_client.get_index_tickers(quote)
+            if result.get('code') != '0':
+                raise RuntimeError("Failed to list %s indices: %s" % (quote, result.get('msg')))
+            insts = [row['instId'] for row in result['data']]
+
+        candle_interval = scanner_config.get("candle_interval", "5m")
+        watchdog = None
+        if feed_config.get("enabled", True):
+            watchdog = FeedWatchdog(feed_config.get("stale_after", 30), feed_config.get("ping_interval", 15),
+                                    feed_config.get("pong_timeout", 10), feed_config.get("max_latency_ms", 5000),
+                                    interval_to_ms(candle_interval))
+        scanner = MarketScanner(insts, candle_interval, scanner_config.get("output", "shortlist.json"),
+                                scanner_config.get("top", 10), scanner_config.get("publish_interval", 5),
+                                restful_client=restful_client, watchdog=watchdog)
+        if scanner_config.get("warmup", True):
+            scanner.warmup()
+        return scanner
@@ -0,0 +1,81 @@
+"""
+CLI 启动开销检查: 在全新的解释器中运行轻量入口, 统计导入耗时并确认没有提前加载重量级依赖。
+supervisor 重启 worker、短生命周期的回测进程每天会启动上百次, 启动开销回退时这里会失败。
+
+Startup budget check. Each lightweight entry point is run in a fresh interpreter with -X importtime; the check
+fails when a heavy dependency gets imported or the import time on top of the bare interpreter exceeds the budget.
+Entry points that need some heavy dependencies (autoearn) only fail when they import any other one, e.g. numpy.
+
+    python startup_check.py [--budget-ms 50] [--runs 5]
+
+tests/test_startup.py runs the same entry points in the test suite and fails on heavy imports (without the time
+budget, which depends on the machine).
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+HEAVY_MODULES = {'okx', 'flask', 'sqlalchemy', 'psycopg2', 'yaml', 'websockets', 'numpy', 'autoearn', 'webapp', 'database'}
+
+# (name, python code run in the fresh interpreter[, heavy modules the entry point needs])
+# 需要重量级依赖的入口只检查没有多余的重量级导入, 不套用时间预算
+ENTRY_POINTS = [
+    ('main --help', "import sys, runpy; sys.argv = ['main.py', '--help']\n"
+                    "try:\n    runpy.run_path('main.py', run_name='__main__')\nexcept SystemExit:\n    pass"),
+    ('supervisor', "import supervisor"),
+    ('marketbus', "import marketbus"),
+    ('autoearn', "import autoearn", {'okx', 'sqlalchemy', 'psycopg2', 'yaml', 'autoearn', 'database'}),
+]
+
+REPORT = "\nimport sys\nprint(','.join(sorted({m.split('.')[0] for m in sys.modules})), file=sys.stderr)"
+
+
+def run(code):
+    """Return (import time in ms for top-level imports after site, set of loaded top-level modules)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code + REPORT],
+                            cwd=here, capture_output=True, text=True, check=True)
+    lines = result.stderr.strip().splitlines()
+    modules = set(lines[-1].split(','))
+    total_us = 0
+    after_site = False
+    for line in lines[:-1]:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  '):
+            continue  # 只统计顶层导入, 嵌套导入已包含在 cumulative 中
+        if after_site:
+            total_us += int(cumulative)
+        elif name.strip() == 'site':
+            after_site = True
+    return total_us / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the lightweight CLI entry points.")
+    parser.add_argument('--budget-ms', type=float, default=50, help="Maximum import time per entry point.")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per entry point, the median is compared.")
+    args = parser.parse_args()
+
+    failed = False
+    for name, code, *needed in ENTRY_POINTS:
+        needed = needed[0] if needed else set()
+        samples = []
+        for _ in range(args.runs):
+            elapsed, modules = run(code)
+            samples.append(elapsed)
+        elapsed = sorted(samples)[len(samples) // 2]
+        heavy = sorted((HEAVY_MODULES - needed) & modules)
+        ok = (needed or elapsed <= args.budget_ms) and not heavy
+        failed |= not ok
+        budget = "no budget, needs " + ", ".join(sorted(needed)) if needed else f"budget {args.budget_ms:.0f}ms"
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {elapsed:.1f}ms ({budget})"
+              + (f", heavy imports: {', '.join(heavy)}" if heavy else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
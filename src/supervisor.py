@@ -0,0 +1,242 @@
+"""
+多进程运行多个策略配置, 每个配置一个独立的 worker 进程, 按 CPU 核心轮流绑定。
+worker 崩溃或卡住(心跳/行情处理超时)后会带着最近一次上报的状态重启, supervisor 汇总各 worker 的健康状况和指标。
+
+Run many strategy configs on one host: one worker process per config, pinned round-robin across cores.
+Crashed or hung workers are restarted with the state they last reported, and health/metrics are aggregated here.
+Workers report on a timer and after every position change, so a restart never resumes from a position older than
+the last order. Orders of all workers go through one OrderGateway in this process, so orders placed at the same time
+by different strategies of an account are coalesced into batch requests and share its rate limits.
+"""
+import glob
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from log import logger
+
+
+HEARTBEAT_INTERVAL = 10  # worker 上报状态的间隔(秒)
+HEARTBEAT_TIMEOUT = 60   # 超过该时间没有心跳, 视为进程卡住
+TICK_TIMEOUT = 300       # 超过该时间没有处理任何K线, 视为交易线程卡住
+
+
+def collect_configs(paths):
+    """Expand directories into the *.yaml/*.yml files they contain, keeping explicit files as given."""
+    configs = []
+    for path in paths:
+        if os.path.isdir(path):
+            configs.extend(sorted(glob.glob(os.path.join(path, "*.yaml")) + glob.glob(os.path.join(path, "*.yml"))))
+        else:
+            configs.append(path)
+    return configs
+
+
+def run_worker(config_path, cpu, status_queue, state, order_requests=None, order_replies=None):
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+    from autoearn import AutoEarn
+    from restfulclient import RemoteOrderBatcher
+    autoearn = AutoEarn.from_config(config_path)
+    if order_requests is not None:
+        client = autoearn.restful_client
+        client.batcher = RemoteOrderBatcher(config_path, client.account, order_requests, order_replies)
+    if state and autoearn.journal is None:
+        # 配置了 journal 的策略在 start() 中从 journal 恢复, 心跳里的状态可能更旧
+        autoearn.restore(state)
+
+    def report():
+        status_queue.put((config_path, os.getpid(), time.time(), autoearn.dump()))
+
+    def heartbeat():
+        while True:
+            report()
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    # 仓位变化立即上报, 重启时不会丢掉刚开的仓位
+    autoearn.position_listeners.append(report)
+    threading.Thread(target=heartbeat, name="heartbeat", daemon=True).start()
+    autoearn.start()
+    if not autoearn.replays_datafile:
+        # 实盘行情不会自己结束, 返回说明连接已放弃(如 PublicClient 捕获了 RuntimeError), 以非0退出让 supervisor 重启
+        logger.error("Feed of %s stopped, exiting for restart", config_path)
+        sys.exit(1)
+
+
+class Worker:
+    def __init__(self, config_path, cpu):
+        self.config_path = config_path
+        self.cpu = cpu
+        self.process = None
+        self.started_at = 0
+        self.restarts = 0
+        self.crashes = 0            # 连续崩溃次数, 用于计算重启退避
+        self.restart_at = None      # 计划重启的时间
+        self.last_heartbeat = 0
+        self.state = None           # 最近一次上报的 AutoEarn.dump()
+        self.finished = False
+        self.hangs = 0              # 因卡住被重启的次数
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def health(self):
+        return {
+            'pid': self.process.pid if self.process else None,
+            'cpu': self.cpu,
+            'alive': self.alive,
+            'finished': self.finished,
+            'restarts': self.restarts,
+            'heartbeat_age': time.time() - self.last_heartbeat if self.last_heartbeat else None,
+            'tick_age': self.state.get('tick_age') if self.state else None,
+            'hangs': self.hangs,
+            'state': self.state,
+        }
+
+    def hung(self, now):
+        """Reason the running worker looks hung, None when it is healthy."""
+        heartbeat_age = now - (self.last_heartbeat or self.started_at)
+        if heartbeat_age > HEARTBEAT_TIMEOUT:
+            return "no heartbeat for %ds" % heartbeat_age
+        if self.state and self.last_heartbeat > self.started_at:
+            tick_age = self.state.get('tick_age', 0) + now - self.last_heartbeat
+            if tick_age > TICK_TIMEOUT:
+                return "no candle processed for %ds" % tick_age
+        return None
+
+
+class Supervisor:
+
+    RESTART_BASE_DELAY = 1
+    RESTART_MAX_DELAY = 60
+    STABLE_SECONDS = 60  # worker 运行超过该时间后再崩溃, 退避从头计算
+
+    def __init__(self, config_paths, cpus=None):
+        if cpus is None:
+            cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [None]
+        self.ctx = multiprocessing.get_context("spawn")
+        self.status_queue = self.ctx.Queue()
+        self.order_requests = self.ctx.Queue()
+        self.gateway = None
+        self.workers = [Worker(path, cpus[i % len(cpus)]) for i, path in enumerate(config_paths)]
+        self.running = False
+
+    def start_worker(self, worker):
+        # 每次启动使用新的应答队列, 上一个进程未取走的应答不会被新进程收到
+        order_replies = self.ctx.Queue()
+        self.gateway.register(worker.config_path, order_replies)
+        worker.process = self.ctx.Process(
+            target=run_worker,
+            args=(worker.config_path, worker.cpu, self.status_queue, worker.state, self.order_requests, order_replies),
+            name=f"autoearn:{os.path.basename(worker.config_path)}",
+            daemon=True)
+        worker.process.start()
+        worker.started_at = time.time()
+        worker.restart_at = None
+        logger.info("Started worker %s (pid %s, cpu %s)", worker.config_path, worker.process.pid, worker.cpu)
+
+    def drain_status(self, timeout):
+        workers = {w.config_path: w for w in self.workers}
+        deadline = time.time() + timeout
+        while True:
+            try:
+                config_path, pid, ts, state = self.status_queue.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                return
+            worker = workers.get(config_path)
+            if worker is not None and worker.process is not None and worker.process.pid == pid:
+                worker.last_heartbeat = ts
+                worker.state = state
+
+    def check_workers(self):
+        now = time.time()
+        for worker in self.workers:
+            if worker.alive:
+                reason = worker.hung(now)
+                if reason is None:
+                    continue
+                # 终止后按崩溃处理, 走下面的退避重启
+                worker.hangs += 1
+                logger.error("Worker %s (pid %s) looks hung: %s, terminating", worker.config_path, worker.process.pid, reason)
+                worker.process.terminate()
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+            if worker.finished:
+                continue
+            if worker.restart_at is None:
+                exitcode = worker.process.exitcode
+                if exitcode == 0:
+                    worker.finished = True
+                    logger.info("Worker %s finished", worker.config_path)
+                    continue
+                if now - worker.started_at > self.STABLE_SECONDS:
+                    worker.crashes = 0
+                delay = min(self.RESTART_MAX_DELAY, self.RESTART_BASE_DELAY * 2 ** worker.crashes)
+                worker.crashes += 1
+                worker.restart_at = now + delay
+                logger.error("Worker %s exited with code %s, restarting in %ds", worker.config_path, exitcode, delay)
+            elif now >= worker.restart_at:
+                worker.restarts += 1
+                self.start_worker(worker)
+
+    def health(self):
+        return {w.config_path: w.health() for w in self.workers}
+
+    def metrics(self):
+        states = [w.state for w in self.workers if w.state]
+        return {
+            'workers': len(self.workers),
+            'alive': sum(1 for w in self.workers if w.alive),
+            'restarts': sum(w.restarts for w in self.workers),
+            'hangs': sum(w.hangs for w in self.workers),
+            'in_position': sum(1 for s in states if s.get('in_position')),
+            'available_balance': sum(s.get('available_balance', 0) for s in states),
+            'reconnect_count': sum(s.get('reconnect_count', 0) for s in states),
+            'gap_fill_count': sum(s.get('gap_fill_count', 0) for s in states),
+        }
+
+    def run(self):
+        if not self.workers:
+            logger.error("No strategy configs to supervise")
+            return
+        from restfulclient import OrderGateway
+        self.gateway = OrderGateway(self.order_requests)
+        self.gateway.start()
+        self.running = True
+        for worker in self.workers:
+            self.start_worker(worker)
+
+        last_report = 0
+        try:
+            while self.running and not all(w.finished for w in self.workers):
+                self.drain_status(1)
+                self.check_workers()
+                if time.time() - last_report >= HEARTBEAT_INTERVAL:
+                    last_report = time.time()
+                    logger.info("Supervisor metrics: %s", self.metrics())
+                    for path, health in self.health().items():
+                        logger.info("Worker %s health: pid=%s alive=%s restarts=%d hangs=%d heartbeat_age=%s tick_age=%s",
+                                    path, health['pid'], health['alive'], health['restarts'], health['hangs'],
+                                    health['heartbeat_age'] and round(health['heartbeat_age'], 1),
+                                    health['tick_age'] and round(health['tick_age'], 1))
+        except KeyboardInterrupt:
+            logger.info("Received exit signal. Stopping workers...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+        if self.gateway is not None:
+            self.order_requests.put(None)
@@ -0,0 +1,149 @@
+"""
+决策轨迹记录: 每个 tick 的 PipelineContext 结果(各 pipeline 的评分贡献、操作、skip、持仓、价格)
+以定长二进制记录追加写入文件, 用于事后分析为什么会发生某笔交易。
+
+Decision trace recorder. Each tick is packed into a fixed-size record in a preallocated buffer and flushed to an
+append-only file in blocks, so recording costs one struct.pack_into per tick. The buffer is also flushed every
+FLUSH_INTERVAL seconds and after every order, so a crash or SIGTERM loses at most a few seconds of ticks. load_trace() reads the columns back,
+through numpy.memmap when numpy is installed.
+
+File layout:
+    magic(8s) header_len(u32) header(json: pipelines, fields, format) records...
+"""
+import json
+import os
+import struct
+import threading
+import time
+
+
+MAGIC = b"AETRACE1"
+PREFIX = struct.Struct("<8sI")
+
+OPERATIONS = [None, 'long', 'short', 'exit']
+POSITIONS = [None, 'long', 'short']
+UNKNOWN = -1  # 不在上面列表中的值(例如新 pipeline 引入的操作)记为 -1, 不在热路径上抛异常
+OPERATION_CODES = {value: i for i, value in enumerate(OPERATIONS)}
+POSITION_CODES = {value: i for i, value in enumerate(POSITIONS)}
+
+# (field, struct code)
+FIELDS = [
+    ('timestamp', 'q'),      # 本次决策所用K线的时间戳(ms)
+    ('local_time', 'q'),     # 本地记录时间(ms)
+    ('price', 'd'),
+    ('operation', 'b'),      # OPERATIONS 下标, 未知为 UNKNOWN
+    ('skip', '?'),
+    ('position', 'b'),       # POSITIONS 下标, 未知为 UNKNOWN
+    ('position_stock', 'd'),
+    ('entry_price', 'd'),
+    ('score', 'd'),
+]
+
+
+def record_format(pipelines):
+    # 每个 pipeline 一列评分贡献, 未执行的 pipeline 记为 NaN
+    return "<" + "".join(code for _, code in FIELDS) + "d" * len(pipelines)
+
+
+class DecisionRecorder:
+
+    FLUSH_RECORDS = 4096
+    FLUSH_INTERVAL = 2  # 秒
+
+    def __init__(self, path, pipelines):
+        self.path = path
+        self.pipelines = list(pipelines)
+        self.record = struct.Struct(record_format(self.pipelines))
+        self.buffer = bytearray(self.record.size * self.FLUSH_RECORDS)
+        self.count = 0
+        self.nan_contributions = [float('nan')] * len(self.pipelines)
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()  # 分阶段运行时下单线程会调用 flush
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        header = json.dumps({
+            'pipelines': self.pipelines,
+            'fields': [name for name, _ in FIELDS],
+            'format': self.record.format,
+        }).encode()
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(PREFIX.pack(MAGIC, len(header)) + header)
+            self.file.flush()
+
+    def append(self, context, timestamp, price):
+        contributions = self.nan_contributions
+        if context.contributions:
+            contributions = [context.contributions.get(name, float('nan')) for name in self.pipelines]
+        with self.lock:
+            self.pack(context, timestamp, price, contributions)
+            if self.count == self.FLUSH_RECORDS or time.monotonic() - self.flushed_at >= self.FLUSH_INTERVAL:
+                self.write()
+
+    def pack(self, context, timestamp, price, contributions):
+        self.record.pack_into(self.buffer, self.count * self.record.size,
+                              timestamp,
+                              time.time_ns() // 1000000,
+                              price,
+                              OPERATION_CODES.get(context.operation, UNKNOWN),
+                              context.skip,
+                              POSITION_CODES.get(context.in_position, UNKNOWN),
+                              context.position_stock or 0,
+                              context.entry_price or 0,
+                              context.score,
+                              *contributions)
+        self.count += 1
+
+    def write(self):
+        if self.count:
+            self.file.write(memoryview(self.buffer)[:self.count * self.record.size])
+            self.file.flush()
+            self.count = 0
+        self.flushed_at = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self.write()
+
+    def close(self):
+        with self.lock:
+            self.write()
+            self.file.close()
+
+
+def load_trace(path):
+    """
+    Load a trace file into columns: {field: array/list, 'contributions': {pipeline: array/list}}.
+    A trailing partial record (e.g. after a crash) is ignored.
+    """
+    with open(path, "rb") as f:
+        magic, header_len = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a decision trace file")
+        header = json.loads(f.read(header_len))
+    offset = PREFIX.size + header_len
+    fields = header['fields']
+    pipelines = header['pipelines']
+    record = struct.Struct(header['format'])
+    count = (os.path.getsize(path) - offset) // record.size
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is not None:
+        codes = header['format'][1:]
+        dtype = np.dtype([(name, "<" + code) for name, code in zip(fields + ["c%d" % i for i in range(len(pipelines))], codes)])
+        data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,)) if count else np.empty(0, dtype=dtype)
+        columns = {name: data[name] for name in fields}
+        columns['contributions'] = {name: data["c%d" % i] for i, name in enumerate(pipelines)}
+        return columns
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        raw = f.read(count * record.size)
+    rows = list(zip(*record.iter_unpack(raw))) or [()] * (len(fields) + len(pipelines))
+    columns = {name: list(rows[i]) for i, name in enumerate(fields)}
+    columns['contributions'] = {name: list(rows[len(fields) + i]) for i, name in enumerate(pipelines)}
+    return columns
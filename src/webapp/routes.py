@@ -1,7 +1,124 @@
-from flask import Blueprint, render_template
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from flask import Blueprint, Response, current_app, render_template, request, stream_with_context
+import profiler
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
 def index():
-    return render_template('index.html')
\ No newline at end of file
+    return render_template('index.html')
+
+@main.route('/profile')
+def profile():
+    """
+    对当前进程采样 seconds 秒, 返回 collapsed-stack 文本 (flamegraph.pl / speedscope 可直接读取)。
+    仅当 webapp 与 AutoEarn 在同一进程中运行时 (main.py -a -w) 才能采到交易线程。
+    """
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', 0.005))
+        if not (math.isfinite(seconds) and math.isfinite(interval)):
+            raise ValueError("must be finite")
+    except ValueError as e:
+        return Response(f"Invalid seconds or interval: {e}", status=400, mimetype='text/plain')
+    seconds = min(seconds, profiler.MAX_SECONDS)
+    interval = max(interval, 0.001)
+    try:
+        output = profiler.profile(seconds, interval)
+    except profiler.ProfilerBusy as e:
+        return Response(str(e), status=409, mimetype='text/plain')
+    return Response(output, mimetype='text/plain')
+
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def get_db():
+    db = current_app.extensions.get('autoearn_db')
+    if db is None:
+        from database import Database
+        db = current_app.extensions['autoearn_db'] = Database(current_app.config['DATABASE_URL'])
+    return db
+
+
+def parse_time(value):
+    """Query parameter as a datetime: epoch milliseconds or ISO 8601, None when absent."""
+    if not value:
+        return None
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value) / 1000)
+    return datetime.fromisoformat(value)
+
+
+def export_response(name, fmt, columns, batches):
+    """
+    逐批编码并输出, 每批对应服务端游标的一次 fetch, 内存占用与导出总行数无关。
+    CSV 表头在查询之前先发出, 客户端立即收到首字节。
+    """
+    def encode(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    def generate():
+        if fmt == 'csv':
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            yield buf.getvalue()
+            for rows in batches:
+                buf.seek(0)
+                buf.truncate()
+                writer.writerows([encode(v) for v in row] for row in rows)
+                yield buf.getvalue()
+        else:
+            for rows in batches:
+                yield "".join(json.dumps(dict(zip(columns, map(encode, row)))) + "\n" for row in rows)
+
+    headers = {'Content-Disposition': f'attachment; filename="{name}.{fmt}"'}
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+
+@main.route('/export/operations')
+def export_operations():
+    """
+    导出 operation 表: /export/operations?format=csv|ndjson&inst=BTC-USDT&start=2024-01-01&end=1735689600000
+    start/end 为毫秒时间戳或 ISO 8601 时间, 区间左闭右开。
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return Response(f"Unsupported format {fmt}, use csv or ndjson", status=400, mimetype='text/plain')
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError as e:
+        return Response(f"Invalid time range: {e}", status=400, mimetype='text/plain')
+
+    from database import Operation
+    columns = [c.name for c in Operation.__table__.columns]
+    batches = get_db().stream_operations(request.args.get('inst'), start, end, current_app.config['EXPORT_BATCH_SIZE'])
+    return export_response("operations", fmt, columns, batches)
+
+
+@main.route('/export/candles')
+def export_candles():
+    """
+    导出已导入的历史K线: /export/candles?format=csv|ndjson&inst=BTC-USDT&bar=1m&start=..&end=..
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return Response(f"Unsupported format {fmt}, use csv or ndjson", status=400, mimetype='text/plain')
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError as e:
+        return Response(f"Invalid time range: {e}", status=400, mimetype='text/plain')
+
+    from database import CANDLE_COLUMNS
+    start_ms = int(start.timestamp() * 1000) if start else None
+    end_ms = int(end.timestamp() * 1000) if end else None
+    batches = get_db().stream_candles(request.args.get('inst'), request.args.get('bar'), start_ms, end_ms,
+                                      current_app.config['EXPORT_BATCH_SIZE'])
+    return export_response("candles", fmt, list(CANDLE_COLUMNS), batches)
@@ -1,44 +1,267 @@
 import asyncio,json
+import collections
+import random
+import re
+import time
+import weakref
 from log import logger
 from okx.websocket.WsPublicAsync import WsPublicAsync
 from okx.websocket.WsPrivateAsync import WsPrivateAsync
-from websockets.exceptions import ConnectionClosedError
+from websockets.exceptions import ConnectionClosed, ConnectionClosedError
 import warnings
 
+class FeedWatchdog:
+    """
+    行情健康检查: 记录每一帧的本地接收时间, 带交易所时间戳的帧计算交易所到本地的延迟(含两端时钟偏差)。
+    超过 max_latency_ms 才到达的数据帧不算新鲜数据, 所以持续延迟的行情和停止推送的行情一样会被判定为过期。
+
+    Frames with a "ts" field (books, tickers) feed the rolling latency window. Candle frames carry the candle
+    start time instead: frames for a period that has already ended (the finished candle) add the lag since the
+    period end to the window, and a candle is late when that lag exceeds max_latency_ms.
+    """
+
+    TS_PATTERN = re.compile(r'"ts":\s*"(\d+)"')
+    CANDLE_TS_PATTERN = re.compile(r'"data":\s*\[\s*\["(\d+)"')
+
+    def __init__(self, stale_after=30, ping_interval=15, pong_timeout=10, max_latency_ms=5000, interval_ms=None, window=1000):
+        self.stale_after = stale_after          # 超过该秒数没有新鲜数据则判定为过期
+        self.ping_interval = ping_interval      # 超过该秒数没有收到任何帧则发送 ping
+        self.pong_timeout = pong_timeout        # ping 后该秒数内没有 pong 则重连
+        self.max_latency_ms = max_latency_ms
+        self.interval_ms = interval_ms          # K线周期, 用于判断K线帧是否迟到
+        now = time.monotonic()
+        self.last_frame = now
+        self.last_fresh = now
+        self.ping_sent = None
+        self.resubscribed_at = None
+        self.latencies = collections.deque(maxlen=window)  # ms
+        self.rtts = collections.deque(maxlen=100)           # ms
+        self.stale = False
+        self.stale_count = 0
+        self.late_frames = 0
+
+    def on_frame(self, message):
+        """Record a received frame. Returns False for pong replies, which are not passed on to the data callback."""
+        now = time.monotonic()
+        self.last_frame = now
+        if message == 'pong':
+            if self.ping_sent is not None:
+                self.rtts.append((now - self.ping_sent) * 1000)
+                self.ping_sent = None
+            return False
+        if '"data"' not in message:
+            return True  # subscribe/error 事件
+
+        match = self.TS_PATTERN.search(message)
+        if match:
+            latency = time.time() * 1000 - int(match.group(1))
+            self.latencies.append(latency)
+            late = latency > self.max_latency_ms
+        elif self.interval_ms:
+            match = self.CANDLE_TS_PATTERN.search(message)
+            late = False
+            if match is not None:
+                # 周期内的推送无法衡量延迟, 只统计周期结束后到达的帧
+                lag = time.time() * 1000 - int(match.group(1)) - self.interval_ms
+                if lag >= 0:
+                    self.latencies.append(lag)
+                    late = lag > self.max_latency_ms
+        else:
+            late = False
+        if late:
+            self.late_frames += 1
+        else:
+            self.last_fresh = now
+        return True
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1) if latencies else None
+        return {
+            'latency_p50_ms': percentile(0.5),
+            'latency_p99_ms': percentile(0.99),
+            'latency_max_ms': round(latencies[-1], 1) if latencies else None,
+            'rtt_ms': round(sum(self.rtts) / len(self.rtts), 1) if self.rtts else None,
+            'seconds_since_fresh': round(time.monotonic() - self.last_fresh, 1),
+            'late_frames': self.late_frames,
+            'stale_count': self.stale_count,
+            'stale': self.stale,
+        }
+
+
+# event loop -> 该 loop 上的 PublicClient; 一个 loop 只安装一个异常处理器, 按任务归属分发给对应的客户端
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def _handle_loop_exception(loop, context):
+    clients = _loop_clients.get(loop, [])
+    task = context.get('task') or context.get('future')
+    owner = next((client for client in clients if task is not None and task in client.tasks), None)
+    if owner is None and len(clients) == 1:
+        owner = clients[0]
+    if owner is not None:
+        owner.handle_exception(loop, context)
+    else:
+        logger.error(f"Unhandled exception: {context}")
+
+
 class PublicClient:
-    def __init__(self, url, subscriptions, callback):
+
+    RECONNECT_BASE_DELAY = 1    # 首次重连的最大等待秒数
+    RECONNECT_MAX_DELAY = 60    # 退避上限
+    WATCH_INTERVAL = 1
+    STATS_INTERVAL = 60
+
+    def __init__(self, url, subscriptions, callback, on_reconnect=None, watchdog=None, on_stale=None):
         self.url = url
         self.ws_public_async = WsPublicAsync(url=url)
         self.subscriptions = subscriptions
         self.callback = callback
+        self.on_reconnect = on_reconnect    # 重连成功后回调, 参数为断线时长(秒)
+        self.watchdog = watchdog            # FeedWatchdog, None 时不做过期检测
+        self.on_stale = on_stale            # 行情过期/恢复时回调, 参数为 (是否过期, 距上次新鲜数据的秒数)
+        self.reconnecting = False
+        self.reconnect_count = 0
+        self.last_reconnect_seconds = 0
         self.loop = asyncio.get_event_loop()
-        self.loop.set_exception_handler(self.handle_exception)
+        self.tasks = weakref.WeakSet()  # 本客户端创建的任务, 用于异常归属
+        if self.loop not in _loop_clients:
+            _loop_clients[self.loop] = []
+            self.loop.set_exception_handler(_handle_loop_exception)
+        _loop_clients[self.loop].append(self)
 
     def handle_exception(self, loop, context):
         exception = context.get('exception')
         if isinstance(exception, ConnectionClosedError):
-            logger.error(f"Connection closed with error: {exception}. Reconnecting...")
-            self.loop.create_task(self.handle_disconnection())
+            logger.error(f"Connection closed with error on {self.url}: {exception}. Reconnecting...")
+            self.spawn(self.handle_disconnection())
         else:
             logger.error(f"Unhandled exception: {context}")
 
+    def spawn(self, coro):
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        return task
+
+    async def connect(self):
+        await self.ws_public_async.connect()
+        websocket = self.ws_public_async.websocket
+        if websocket is None:
+            raise ConnectionError(f"Failed to connect to {self.url}")
+        if self.watchdog:
+            self.watchdog.last_frame = time.monotonic()
+            self.watchdog.ping_sent = None
+        self.spawn(self.consume(websocket))
+
+    def on_message(self, message):
+        if self.watchdog and not self.watchdog.on_frame(message):
+            return
+        self.callback(message)
+
+    async def consume(self, websocket):
+        try:
+            await self.ws_public_async.consume()
+        except ConnectionClosed as e:
+            logger.error(f"Connection closed with error: {e}")
+        # 只有当前连接断开才重连, 旧连接在重连过程中被关闭时忽略
+        if self.ws_public_async.factory.websocket is websocket:
+            await self.handle_disconnection()
+
     async def subscribe(self, params, callback):
         self.callback = callback
         self.subscriptions = params
-        await self.ws_public_async.start()
-        await self.ws_public_async.subscribe(params, callback)
+        await self.connect()
+        await self.ws_public_async.subscribe(params, self.on_message)
+
+    def backoff_delay(self, attempt):
+        # Full jitter: 在 [0, min(max, base * 2^attempt)] 之间随机等待, 避免多个实例同时重连
+        return random.uniform(0, min(self.RECONNECT_MAX_DELAY, self.RECONNECT_BASE_DELAY * 2 ** attempt))
 
     async def handle_disconnection(self):
+        if self.reconnecting:
+            return
+        self.reconnecting = True
+        started = time.monotonic()
         logger.info("Connection lost. Reconnecting...")
-        await self.ws_public_async.stop()
-        await asyncio.sleep(2)
-        await self.ws_public_async.start()
-        await self.resubscribe()
+        try:
+            await self.ws_public_async.factory.close()
+            attempt = 0
+            while True:
+                delay = self.backoff_delay(attempt)
+                logger.info("Reconnect attempt %d in %.2fs", attempt + 1, delay)
+                await asyncio.sleep(delay)
+                try:
+                    await self.connect()
+                    break
+                except (ConnectionError, OSError) as e:
+                    logger.error(f"Reconnect attempt {attempt + 1} failed: {e}")
+                    attempt += 1
+
+            self.reconnect_count += 1
+            self.last_reconnect_seconds = time.monotonic() - started
+            logger.info("Reconnected after %.2fs (%d attempts, %d reconnects in total)",
+                        self.last_reconnect_seconds, attempt + 1, self.reconnect_count)
+            if self.on_reconnect:
+                self.on_reconnect(self.last_reconnect_seconds)
+            await self.resubscribe()
+        finally:
+            self.reconnecting = False
 
     async def resubscribe(self):
         if self.subscriptions:
             logger.info("Resubscribing to active channels...")
-            await self.ws_public_async.subscribe(self.subscriptions, self.callback)
+            await self.ws_public_async.subscribe(self.subscriptions, self.on_message)
+
+    async def watch(self):
+        """Ping an idle connection, reconnect when pongs stop, resubscribe and report when data goes stale."""
+        watchdog = self.watchdog
+        reported = time.monotonic()
+        while True:
+            await asyncio.sleep(self.WATCH_INTERVAL)
+            now = time.monotonic()
+            if now - reported >= self.STATS_INTERVAL:
+                logger.info("Feed %s: %s", self.url, watchdog.stats())
+                reported = now
+            if self.reconnecting:
+                continue
+
+            if watchdog.ping_sent is not None:
+                if now - watchdog.ping_sent > watchdog.pong_timeout:
+                    logger.warning("No pong within %ss, reconnecting", watchdog.pong_timeout)
+                    watchdog.ping_sent = None
+                    self.spawn(self.handle_disconnection())
+                    continue
+            elif now - watchdog.last_frame >= watchdog.ping_interval:
+                try:
+                    await self.ws_public_async.websocket.send("ping")
+                    watchdog.ping_sent = now
+                except ConnectionClosed:
+                    pass  # consume() 负责重连
+
+            idle = now - watchdog.last_fresh
+            if idle >= watchdog.stale_after:
+                if not watchdog.stale:
+                    watchdog.stale = True
+                    watchdog.stale_count += 1
+                    logger.warning("Feed stale for %.1fs (late frames: %d), resubscribing", idle, watchdog.late_frames)
+                    if self.on_stale:
+                        self.on_stale(True, idle)
+                    watchdog.resubscribed_at = now
+                    try:
+                        await self.resubscribe()
+                    except ConnectionClosed:
+                        pass
+                elif now - watchdog.resubscribed_at >= watchdog.stale_after:
+                    # 重新订阅后仍然没有数据, 重建连接
+                    logger.warning("Feed still stale %.1fs after resubscribing, reconnecting", now - watchdog.resubscribed_at)
+                    watchdog.resubscribed_at = now
+                    self.spawn(self.handle_disconnection())
+            elif watchdog.stale:
+                watchdog.stale = False
+                logger.info("Feed recovered after %d stale periods", watchdog.stale_count)
+                if self.on_stale:
+                    self.on_stale(False, idle)
 
     def stop(self):
         if self.loop.is_running():
@@ -61,18 +284,15 @@ class PublicClient:
                 self.loop.close()
 
     async def run_client(self):
-        while True:
-            try:
-                await self.subscribe(self.subscriptions, self.callback)
-                await asyncio.Future()  # Keep the client running until interrupted
-            except ConnectionClosedError as e:
-                logger.error(f"Connection closed with error: {e}. Reconnecting...")
-                await self.handle_disconnection()
-            except Exception as e:
-                logger.error(f"Unexpected error: {e}")
-                break
-
-
+        try:
+            await self.subscribe(self.subscriptions, self.callback)
+        except (ConnectionClosedError, ConnectionError) as e:
+            logger.error(f"Connection closed with error: {e}. Reconnecting...")
+            await self.handle_disconnection()
+        if self.watchdog:
+            self.watchdog.last_fresh = time.monotonic()
+            self.spawn(self.watch())
+        await asyncio.Future()  # Keep the client running until interrupted, reconnects are handled by consume()
 
 class PrivateClient(WsPrivateAsync):
     def __init__(self, url, apiKey, passphrase, secretKey):
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 源码按 src 目录下的顶层模块导入 (python main.py 在 src 中运行)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,40 @@
+from sqlalchemy import text
+
+from database import Database
+
+HOUR = 3600 * 1000
+
+
+def rollup_rows(db):
+    with db.engine.begin() as conn:
+        return [tuple(row) for row in conn.execute(text("SELECT * FROM candle_rollup ORDER BY inst, bar, ts"))]
+
+
+def test_rollup_uses_finest_source_bar_only():
+    db = Database("sqlite://")
+    db.create_table()
+    rows = [('A', '1m', i * 60000, 100 + i, 200 + i, 50 + i, 101 + i) for i in range(120)]
+    rows += [('A', '5m', i * 300000, 999, 9999, 1, 999) for i in range(24)]  # 与 1m 重复, 不参与聚合
+    rows += [('A', '1D', 0, 1, 2, 0.5, 1.5)]                                 # 比 1H 粗, 原样保留
+    rows += [('B', '5m', i * 300000, 10 + i, 20 + i, 5 + i, 11 + i) for i in range(12)]
+    db.load_candles(rows)
+
+    db.rollup_candles(0, 2 * HOUR, '1H')
+
+    assert rollup_rows(db) == [
+        ('A', '1D', 0, 1.0, 2.0, 0.5, 1.5),
+        ('A', '1H', 0, 100.0, 259.0, 50.0, 160.0),
+        ('A', '1H', HOUR, 160.0, 319.0, 110.0, 220.0),
+        ('B', '1H', 0, 10.0, 31.0, 5.0, 22.0),
+    ]
+
+
+def test_rollup_merges_bucket_split_across_runs():
+    db = Database("sqlite://")
+    db.create_table()
+    db.load_candles([('A', '1m', i * 60000, 100 + i, 200 + i, 50 + i, 101 + i) for i in range(60)])
+
+    db.rollup_candles(0, 30 * 60000, '1H')
+    db.rollup_candles(30 * 60000, HOUR, '1H')
+
+    assert rollup_rows(db) == [('A', '1H', 0, 100.0, 259.0, 50.0, 160.0)]
@@ -0,0 +1,50 @@
+import os
+
+from autoearn import Candle
+from journal import StateJournal
+
+
+def candle(t):
+    return Candle(t, 100 + t, 101 + t, 99 + t, 100.5 + t, True)
+
+
+def test_recover_from_snapshot_and_journal_after_crash(tmp_path):
+    journal = StateJournal(tmp_path, "BTC-USDT-5m", snapshot_interval=5)
+    journal.record_position(1000, None, 0, 0)
+    for t in range(6):
+        journal.record_candle(candle(t))  # 第5条写快照并清空 journal
+    journal.record_position(500, 'long', 5, 100.0, 'tpsl-1')
+    journal.record_candle(candle(6))
+    # 崩溃: 最后一条只写了一半, 不调用 close
+    journal.file.write('{"t": "candle", "c": [7, 10')
+    journal.file.flush()
+
+    assert os.path.exists(journal.snapshot_path)
+    recovered = StateJournal(tmp_path, "BTC-USDT-5m", snapshot_interval=100)
+    state = recovered.recover()
+    assert state['in_position'] == 'long'
+    assert state['position_stock'] == 5
+    assert state['available_balance'] == 500
+    assert state['tpsl_algo_id'] == 'tpsl-1'
+    assert [c[0] for c in state['candles']] == list(range(7))
+
+    # 恢复后继续写入, 再次恢复时不能因为前面的半行丢掉新记录
+    recovered.record_candle(candle(7))
+    recovered.close()
+    state = StateJournal(tmp_path, "BTC-USDT-5m", snapshot_interval=100).recover()
+    assert [c[0] for c in state['candles']] == list(range(8))
+
+
+def test_record_position_skips_unchanged_position(tmp_path):
+    journal = StateJournal(tmp_path, "ETH-USDT-5m")
+    journal.record_position(1000, None, 0, 0)
+    journal.record_position(1000, None, 0, 0)
+    journal.record_position(900, 'short', 1, 90.0)
+    journal.record_position(900, 'short', 1, 90.0)
+    journal.close()
+    with open(journal.journal_path) as f:
+        assert len(f.readlines()) == 2
+
+
+def test_recover_without_files_returns_none(tmp_path):
+    assert StateJournal(tmp_path, "none").recover() is None
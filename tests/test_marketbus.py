@@ -0,0 +1,90 @@
+import uuid
+
+import pytest
+
+from marketbus import HEADER_SIZE, SEQ, SLOT, MarketBusReader, MarketBusWriter, bus_key
+
+KEY = bus_key("BTC-USDT", "5m")
+
+
+@pytest.fixture
+def name():
+    return "aetest-" + uuid.uuid4().hex[:8]
+
+
+def publish(writer, timestamps, key=KEY):
+    for ts in timestamps:
+        writer.publish(key, ts, 1.0, 2.0, 0.5, 1.5, True)
+
+
+def timestamps(records):
+    return [record[0] for record in records]
+
+
+def test_reader_reports_lap_and_skips_to_the_oldest_record(name):
+    writer = MarketBusWriter(name, capacity=8)
+    reader = MarketBusReader(name, KEY)
+    try:
+        publish(writer, range(1, 21))
+        assert timestamps(reader.poll()) == list(range(13, 21))
+        assert reader.dropped == 12
+        publish(writer, [21])
+        assert timestamps(reader.poll()) == [21]
+        assert reader.dropped == 12
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_reader_filters_by_key(name):
+    writer = MarketBusWriter(name, capacity=8)
+    reader = MarketBusReader(name, KEY)
+    try:
+        writer.publish(bus_key("ETH-USDT", "5m"), 1, 1.0, 1.0, 1.0, 1.0, False)
+        publish(writer, [2])
+        assert timestamps(reader.poll()) == [2]
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_slot_overwritten_during_read_is_dropped(name):
+    writer = MarketBusWriter(name, capacity=8)
+    reader = MarketBusReader(name, KEY)
+    try:
+        publish(writer, [1, 2, 3])
+        # 写入方正在改写第2个槽位: 槽位序号已清零
+        SEQ.pack_into(writer.buf, HEADER_SIZE + SLOT.size, 0)
+        assert timestamps(reader.poll()) == [1, 3]
+        assert reader.dropped == 1
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_reader_reattaches_after_writer_restart(name):
+    writer = MarketBusWriter(name, capacity=8)
+    reader = MarketBusReader(name, KEY)
+    reader.REATTACH_INTERVAL = 0
+    try:
+        publish(writer, [1, 2])
+        assert timestamps(reader.poll()) == [1, 2]
+
+        # 正常退出: epoch 置 0, 新的写入方用同名共享内存
+        writer.close()
+        writer = MarketBusWriter(name, capacity=8)
+        publish(writer, [3])
+        assert timestamps(reader.poll()) == [3]
+        assert reader.reattach_count == 1
+
+        # 异常退出: 旧段没有关闭, 新的写入方删除并重建同名共享内存, epoch 不同
+        crashed = writer
+        writer = MarketBusWriter(name, capacity=8)
+        publish(writer, [4, 5])
+        assert timestamps(reader.poll()) == [4, 5]
+        assert reader.reattach_count == 2
+        crashed.buf = None
+        crashed.shm.close()
+    finally:
+        reader.close()
+        writer.close()
@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+
+from ratelimit import TokenBucket, RateLimiter
+from restfulclient import OrderBatcher, OrderGateway, RemoteOrderBatcher
+
+ACCOUNT = ('key', 'secret', 'passphrase', '1')
+
+
+def order(clOrdId, instId='BTC-USDT'):
+    return {'clOrdId': clOrdId, 'instId': instId, 'side': 'buy', 'sz': '1', 'tdMode': 'cash', 'ordType': 'market'}
+
+
+class StubTradeAPI:
+    """place_order blocks until released, so orders submitted meanwhile queue up for the next batch."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def place_order(self, **order):
+        self.calls.append([order['clOrdId']])
+        self.release.wait(5)
+        return {'code': '0', 'msg': '', 'data': [{'ordId': 'o-' + order['clOrdId'], 'clOrdId': order['clOrdId'], 'sCode': '0', 'sMsg': ''}]}
+
+    def place_multiple_orders(self, orders):
+        self.calls.append([o['clOrdId'] for o in orders])
+        # 交易所返回的顺序与请求不一致, 其中一个订单失败
+        rows = [{'ordId': '' if o['clOrdId'] == 'bad' else 'o-' + o['clOrdId'], 'clOrdId': o['clOrdId'],
+                 'sCode': '51008' if o['clOrdId'] == 'bad' else '0', 'sMsg': ''} for o in reversed(orders)]
+        return {'code': '2', 'msg': '', 'data': rows}
+
+
+class StubClient:
+    def __init__(self):
+        self.limiter = RateLimiter()
+        self.trade = StubTradeAPI()
+        self.batcher = OrderBatcher(self)
+
+    def tradeAPI(self):
+        return self.trade
+
+
+def test_batch_results_are_routed_by_clordid():
+    client = StubClient()
+    batcher = client.batcher
+    futures = {}
+    futures['a'] = batcher.submit(order('a'))
+    time.sleep(0.1)  # 'a' 单独发出并阻塞, 后面三个合并为一批
+    for clOrdId in ['b', 'bad', 'c']:
+        futures[clOrdId] = batcher.submit(order(clOrdId, 'ETH-USDT'))
+    client.trade.release.set()
+
+    results = {clOrdId: future.result(5) for clOrdId, future in futures.items()}
+    assert client.trade.calls == [['a'], ['b', 'bad', 'c']]
+    for clOrdId in ['a', 'b', 'c']:
+        assert results[clOrdId]['code'] == '0'
+        assert results[clOrdId]['data'][0]['ordId'] == 'o-' + clOrdId
+    assert results['bad']['code'] == '1'
+    assert results['bad']['data'][0]['sCode'] == '51008'
+
+
+def test_gateway_coalesces_orders_of_different_workers():
+    requests = queue.Queue()
+    gateway = OrderGateway(requests)
+    client = gateway.clients[ACCOUNT] = StubClient()
+    workers = {}
+    for name in ['w1', 'w2', 'w3']:
+        replies = queue.Queue()
+        gateway.register(name, replies)
+        workers[name] = RemoteOrderBatcher(name, ACCOUNT, requests, replies)
+    gateway.start()
+
+    first = workers['w1'].submit(order('w1-1'))
+    time.sleep(0.1)
+    second = workers['w2'].submit(order('w2-1'))
+    third = workers['w3'].submit(order('w3-1'))
+    time.sleep(0.1)
+    client.trade.release.set()
+
+    assert first.result(5)['data'][0]['clOrdId'] == 'w1-1'
+    assert second.result(5)['data'][0]['clOrdId'] == 'w2-1'
+    assert third.result(5)['data'][0]['clOrdId'] == 'w3-1'
+    assert client.trade.calls == [['w1-1'], ['w2-1', 'w3-1']]
+    requests.put(None)
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(rate=20, capacity=2)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    started = time.monotonic()
+    waited = bucket.acquire()
+    elapsed = time.monotonic() - started
+    assert waited > 0
+    assert elapsed >= 0.04  # 一个令牌 1/20 秒
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import orderid
+from orderid import ClientOrderIdGenerator
+from restfulclient import OrderUnresolved, RestfulClient
+
+
+def test_order_ids_are_unique_and_ordered():
+    generator = ClientOrderIdGenerator()
+    ids = [generator.next('buy') for _ in range(20000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(len(i) <= 32 and i.isalnum() and i[0] == 'b' for i in ids)
+
+
+def test_order_ids_are_unique_across_threads():
+    generator = ClientOrderIdGenerator()
+    ids = []
+    lock = threading.Lock()
+
+    def generate():
+        local = [generator.next('sell') for _ in range(5000)]
+        with lock:
+            ids.extend(local)
+
+    threads = [threading.Thread(target=generate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 20000
+
+
+def test_order_ids_keep_increasing_when_the_clock_goes_back(monkeypatch):
+    generator = ClientOrderIdGenerator()
+    clock = iter([5000, 5000, 4000, 3000, 6000])
+    monkeypatch.setattr(orderid.time, 'time_ns', lambda: next(clock) * 1000000)
+    ids = [generator.next('buy') for _ in range(5)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 5
+
+
+class StubTradeAPI:
+    """place_order results and get_order answers are consumed in order; exceptions in the lists are raised."""
+
+    def __init__(self, placements, lookups=()):
+        self.placements = list(placements)
+        self.lookups = list(lookups)
+        self.placed = []
+        self.looked_up = 0
+
+    def place_order(self, **order):
+        self.placed.append(order['clOrdId'])
+        result = self.placements.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get_order(self, instId, ordId='', clOrdId=''):
+        self.looked_up += 1
+        result = self.lookups.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def placed(clOrdId, sCode='0'):
+    return {'code': '0' if sCode == '0' else '1', 'msg': '',
+            'data': [{'ordId': 'o-' + clOrdId if sCode == '0' else '', 'clOrdId': clOrdId, 'sCode': sCode, 'sMsg': ''}]}
+
+
+FOUND = {'code': '0', 'msg': '', 'data': [{'ordId': 'o-found', 'clOrdId': 'c1'}]}
+NOT_EXIST = {'code': RestfulClient.ORDER_NOT_EXIST, 'msg': 'Order does not exist', 'data': []}
+
+
+def make_client(trade):
+    client = RestfulClient('key', 'secret', 'passphrase', '1')
+    client.TradeApi = trade
+    client.LOOKUP_DELAY = 0
+    return client
+
+
+def test_timeout_then_lookup_finds_the_order():
+    trade = StubTradeAPI([TimeoutError("read timed out")], [FOUND])
+    row = make_client(trade).submit_order('c1', 'BTC-USDT', 'buy', 1)
+    assert row['ordId'] == 'o-found'
+    assert trade.placed == ['c1']
+
+
+def test_order_not_exist_is_resubmitted_with_the_same_id():
+    trade = StubTradeAPI([TimeoutError("read timed out"), placed('c1')], [NOT_EXIST])
+    row = make_client(trade).submit_order('c1', 'BTC-USDT', 'buy', 1)
+    assert row['ordId'] == 'o-c1'
+    assert trade.placed == ['c1', 'c1']
+
+
+def test_failed_lookups_raise_unresolved_without_resubmitting():
+    lookups = [ConnectionError("reset")] * (RestfulClient.LOOKUP_ATTEMPTS - 1) + [{'code': '50001', 'msg': 'busy', 'data': []}]
+    trade = StubTradeAPI([TimeoutError("read timed out")], lookups)
+    with pytest.raises(OrderUnresolved):
+        make_client(trade).submit_order('c1', 'BTC-USDT', 'buy', 1)
+    assert trade.placed == ['c1']
+    assert trade.looked_up == RestfulClient.LOOKUP_ATTEMPTS
+
+
+def test_lookup_retries_until_it_gets_an_answer():
+    trade = StubTradeAPI([TimeoutError("read timed out")], [ConnectionError("reset"), FOUND])
+    row = make_client(trade).submit_order('c1', 'BTC-USDT', 'buy', 1)
+    assert row['ordId'] == 'o-found'
+    assert trade.looked_up == 2
+
+
+def test_duplicated_clordid_returns_the_existing_order():
+    trade = StubTradeAPI([placed('c1', RestfulClient.DUPLICATED_CLORDID)], [FOUND])
+    row = make_client(trade).submit_order('c1', 'BTC-USDT', 'buy', 1)
+    assert row['ordId'] == 'o-found'
+    assert trade.placed == ['c1']
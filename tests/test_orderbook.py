@@ -0,0 +1,88 @@
+import json
+import zlib
+
+from autoearn import AutoEarn
+from orderbook import OrderBook
+
+
+def signed_crc32(s):
+    crc = zlib.crc32(s.encode())
+    return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+
+def snapshot(seq_id=10):
+    data = {'bids': [['3366.1', '7', '0', '3'], ['3366', '6', '3', '4']],
+            'asks': [['3366.8', '9', '10', '3'], ['3368', '8', '3', '4'], ['3370', '1', '0', '1']],
+            'seqId': seq_id, 'ts': '1700000000000'}
+    # 买卖盘交错, 卖盘多出的价位接在后面
+    data['checksum'] = signed_crc32("3366.1:7:3366.8:9:3366:6:3368:8:3370:1")
+    return data
+
+
+def test_checksum_interleaves_levels_as_signed_crc32():
+    book = OrderBook()
+    assert book.apply('snapshot', snapshot())
+    assert book.valid
+    assert book.best_bid == (3366.1, 7.0)
+    assert book.best_ask == (3366.8, 9.0)
+
+
+def test_checksum_mismatch_invalidates_book():
+    book = OrderBook()
+    data = snapshot()
+    data['checksum'] += 1
+    assert not book.apply('snapshot', data)
+    assert not book.valid
+    assert book.checksum_failures == 1
+
+
+def test_update_follows_seq_id_and_removes_empty_levels():
+    book = OrderBook()
+    book.apply('snapshot', snapshot())
+    update = {'bids': [['3366.1', '0', '0', '0']], 'asks': [], 'prevSeqId': 10, 'seqId': 11}
+    update['checksum'] = signed_crc32("3366:6:3366.8:9:3368:8:3370:1")
+    assert book.apply('update', update)
+    assert book.seq_id == 11
+    assert book.best_bid == (3366.0, 6.0)
+
+
+def test_sequence_gap_invalidates_until_next_snapshot():
+    book = OrderBook()
+    book.apply('snapshot', snapshot())
+    assert not book.apply('update', {'bids': [['3365', '1', '0', '1']], 'asks': [], 'prevSeqId': 12, 'seqId': 13})
+    assert not book.valid
+    # 后续增量在新快照到达前都被拒绝
+    assert not book.apply('update', {'bids': [], 'asks': [], 'prevSeqId': 13, 'seqId': 14})
+    assert book.apply('snapshot', snapshot(20))
+    assert book.valid and book.seq_id == 20
+
+
+class StubClient:
+    def __init__(self):
+        self.resubscribes = 0
+
+    async def handle_disconnection(self):
+        pass
+
+    def spawn(self, coro):
+        coro.close()
+        self.resubscribes += 1
+
+
+def test_updates_on_invalid_book_resubscribe_throttled(monkeypatch):
+    autoearn = AutoEarn.__new__(AutoEarn)
+    autoearn.book = OrderBook()
+    autoearn.book_client = StubClient()
+    autoearn.book_resubscribed_at = -AutoEarn.BOOK_RESUBSCRIBE_INTERVAL
+    autoearn.book.apply('snapshot', snapshot())
+    autoearn.book.valid = False  # 例如 on_book_stale 之后
+
+    now = [1000.0]
+    monkeypatch.setattr('autoearn.time.monotonic', lambda: now[0])
+    message = json.dumps({'action': 'update', 'data': [{'bids': [], 'asks': [], 'prevSeqId': 10, 'seqId': 11}]})
+    autoearn.parseBook(message)
+    autoearn.parseBook(message)
+    assert autoearn.book_client.resubscribes == 1
+    now[0] += AutoEarn.BOOK_RESUBSCRIBE_INTERVAL
+    autoearn.parseBook(message)
+    assert autoearn.book_client.resubscribes == 2
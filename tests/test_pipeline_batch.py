@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from autoearn import Candle
+from pipeline import CalculateScorePipeline, PipelineContext
+
+
+def random_context_args(rng):
+    last_candles = []
+    for t in range(rng.randint(0, 30)):
+        _open = round(100 + rng.uniform(-3, 3), 2)
+        if rng.random() < 0.1:
+            close = _open  # 十字星
+        else:
+            close = _open * (1 + rng.choice([-1, 1]) * rng.uniform(0, 0.06))
+        last_candles.append(Candle(t, _open, _open, _open, close, True))
+    current_candles = []
+    if rng.random() < 0.7:
+        close = 100 * (1 + rng.uniform(-0.08, 0.08))
+        current_candles.append(Candle(len(last_candles), 100, 100, 100, close, False))
+    in_position = rng.choice([None, None, 'long', 'short'])
+    return last_candles, current_candles, in_position, 1.0, rng.uniform(90, 110)
+
+
+def result(context):
+    return context.score, context.operation, context.skip, context.contributions
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_execute_batch_matches_execute(seed):
+    rng = random.Random(seed)
+    args = [random_context_args(rng) for _ in range(3000)]
+    scalar = [PipelineContext(*a) for a in args]
+    batch = [PipelineContext(*a) for a in args]
+
+    pipeline = CalculateScorePipeline()
+    for context in scalar:
+        pipeline.execute(context)
+    pipeline.execute_batch(batch)
+
+    # 逐位相等, 不允许浮点误差
+    assert [result(c) for c in batch] == [result(c) for c in scalar]
+    assert any(c.operation == 'long' for c in scalar)
+
+
+def test_execute_batch_empty():
+    assert CalculateScorePipeline().execute_batch([]) == []
@@ -0,0 +1,41 @@
+import asyncio
+import collections
+
+from runtime import StageStats, StagedRuntime
+
+
+class FakeCandle:
+    def __init__(self, timestamp, isfinish):
+        self.timestamp = timestamp
+        self.isfinish = isfinish
+
+
+def make_runtime(maxsize):
+    runtime = StagedRuntime.__new__(StagedRuntime)
+    runtime.loop = asyncio.get_running_loop()
+    runtime.decision_queue = asyncio.Queue(maxsize)
+    runtime.decision_stats = StageStats("decision", runtime.decision_queue)
+    runtime.pending = collections.deque()
+    runtime.drainer = None
+    return runtime
+
+
+def test_finished_candles_keep_their_order_when_the_queue_is_full():
+    async def run():
+        runtime = make_runtime(2)
+        for timestamp, isfinish in [(1, False), (2, False), (3, True), (4, False), (5, True), (6, False)]:
+            runtime.enqueue((runtime.CANDLE, FakeCandle(timestamp, isfinish)), keep=isfinish)
+        runtime.on_reconnect(1.5)
+
+        received = []
+        while len(received) < 5:
+            kind, payload = await runtime.decision_queue.get()
+            received.append(payload.timestamp if kind == runtime.CANDLE else kind)
+            if len(received) == 2:
+                # 队列有空位但 FIFO 未清空, 未完成K线不能插到已完成K线前面
+                runtime.enqueue((runtime.CANDLE, FakeCandle(7, False)), keep=False)
+        return received, runtime.decision_stats.dropped
+
+    received, dropped = asyncio.run(run())
+    assert received == [1, 2, 3, 5, StagedRuntime.RECONNECT]
+    assert dropped == 3
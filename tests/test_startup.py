@@ -0,0 +1,12 @@
+import pytest
+
+from startup_check import ENTRY_POINTS, HEAVY_MODULES, run
+
+
+@pytest.mark.parametrize("entry_point", ENTRY_POINTS, ids=[entry[0] for entry in ENTRY_POINTS])
+def test_entry_point_imports_no_extra_heavy_modules(entry_point):
+    # 导入耗时受机器负载影响, 这里只检查重量级依赖, 时间预算由 startup_check.py 手动检查
+    name, code, *needed = entry_point
+    needed = needed[0] if needed else set()
+    _, modules = run(code)
+    assert not (HEAVY_MODULES - needed) & modules